@@ -0,0 +1,261 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import fitz
+
+import extract
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INPUT_DIR = os.path.join(REPO_ROOT, "input")
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+
+SAMPLE_PDFS = [f"file0{i}.pdf" for i in range(1, 6)]
+SYNTHETIC_PAGE_COUNTS = [10, 100, 500]
+
+CHUNKS = 5 # Same split as the Go orchestrator
+
+SLOWDOWN_TOLERANCE = 0.2 # Fail the comparison when pages/sec drops by more than 20%
+
+MIN_COMPARABLE_SECONDS = 0.1 # Cases faster than this are too noisy to compare between runs
+
+
+def generate_synthetic_pdf(path, page_count):
+    """
+    Writes a PDF with numbered headings, body paragraphs and a running header/footer on every page.
+    """
+    doc = fitz.open()
+    body_text = ("Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor "
+                 "incididunt ut labore et dolore magna aliqua. ")
+    for page_num in range(page_count):
+        page = doc.new_page()
+        page.insert_text((72, 40), "Synthetic Benchmark Document", fontsize=9)
+
+        y = 80
+        if page_num == 0:
+            page.insert_text((72, y), "Synthetic Outline Benchmark", fontsize=24, fontname="hebo")
+            y += 50
+
+        for section in range(3):
+            page.insert_text((72, y), f"{page_num + 1}.{section + 1} Section {page_num + 1}.{section + 1}", fontsize=16, fontname="hebo")
+            y += 26
+            for _ in range(6):
+                page.insert_text((72, y), body_text[:90], fontsize=10)
+                y += 14
+            y += 16
+
+        page.insert_text((72, 800), f"Page {page_num + 1} of {page_count}", fontsize=9)
+
+    doc.save(path)
+    doc.close()
+
+
+def run_stages(pdf_path):
+    """
+    Runs extract_pdf_outline with instrumentation on.
+    Returns the outline and the time spent per stage.
+    """
+    with extract.collect_metrics() as metrics:
+        outline = extract.extract_pdf_outline(pdf_path)
+    return outline, dict(metrics.stage_seconds), dict(metrics.counters)
+
+
+def run_chunked(pdf_path):
+    """Runs the profile + page-range path used by the Go orchestrator, sequentially."""
+    profile = extract.build_document_profile(pdf_path)
+    page_count = profile["page_count"]
+    chunk_size = max(1, (page_count + CHUNKS - 1) // CHUNKS)
+    results = [
+        extract.extract_pdf_outline(pdf_path, start_page, start_page + chunk_size, profile)
+        for start_page in range(0, page_count, chunk_size)
+    ]
+    return extract.merge_range_outlines(results)
+
+
+def benchmark_case(case):
+    """
+    Runs one benchmark case. Meant to run in a fresh process so that peak RSS belongs to this case only.
+    """
+    pdf_path = case["pdf"]
+    with fitz.open(pdf_path) as doc:
+        page_count = len(doc)
+
+    result = {"name": case["name"], "path": case["path"], "pages": page_count}
+    run_start = time.perf_counter()
+
+    if case["path"] == "single":
+        outline, stage_seconds, counters = run_stages(pdf_path)
+        result["stage_seconds"] = {stage: round(seconds, 6) for stage, seconds in stage_seconds.items()}
+        result["counters"] = counters
+    elif case["path"] == "chunked":
+        outline = run_chunked(pdf_path)
+    elif case["path"] == "low_memory":
+        outline = extract.extract_pdf_outline(pdf_path, low_memory=True)
+    else:
+        raise ValueError(f"Unknown benchmark path: {case['path']}")
+
+    seconds = time.perf_counter() - run_start
+    result["seconds"] = round(seconds, 6)
+    result["pages_per_second"] = round(page_count / seconds, 2) if seconds > 0 else None
+    result["headings"] = len(outline["outline"])
+    result["peak_rss_mb"] = extract.peak_rss_mb()
+
+    golden_path = case.get("golden")
+    if golden_path:
+        result["golden"] = compare_with_golden(outline, golden_path)
+
+    return result, outline
+
+
+def compare_with_golden(outline, golden_path):
+    """Compares an outline with a stored golden JSON; returns a small machine-readable diff."""
+    if not os.path.exists(golden_path):
+        return {"match": None, "reason": "missing golden"}
+
+    with open(golden_path, "r", encoding="utf-8") as f:
+        golden = json.load(f)
+
+    actual_headings = [(h["level"], h["text"], h["page"]) for h in outline["outline"]]
+    golden_headings = [(h["level"], h["text"], h["page"]) for h in golden["outline"]]
+    missing = [h for h in golden_headings if h not in actual_headings]
+    extra = [h for h in actual_headings if h not in golden_headings]
+
+    return {
+        "match": outline == golden,
+        "title_match": outline["title"] == golden["title"],
+        "missing": [list(h) for h in missing],
+        "extra": [list(h) for h in extra],
+    }
+
+
+def benchmark_batch(pdf_paths):
+    """Times run_batch over all PDFs at once (file/page-range scheduling over a process pool)."""
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_dir = os.path.join(work_dir, "input")
+        os.makedirs(input_dir)
+        for pdf_path in pdf_paths:
+            shutil.copy(pdf_path, input_dir)
+
+        page_count = sum(extract.count_pages(pdf_path) for pdf_path in pdf_paths)
+        run_start = time.perf_counter()
+        with open(os.devnull, "w") as devnull:
+            sys.stdout, stdout = devnull, sys.stdout
+            try:
+                extract.run_batch(input_dir, os.path.join(work_dir, "output"))
+            finally:
+                sys.stdout = stdout
+        seconds = time.perf_counter() - run_start
+
+    return {
+        "name": "corpus",
+        "path": "batch",
+        "pages": page_count,
+        "seconds": round(seconds, 6),
+        "pages_per_second": round(page_count / seconds, 2) if seconds > 0 else None,
+        "workers": extract.available_cpu_count(),
+    }
+
+
+def compare_runs(current, baseline):
+    """Lists the cases whose pages/sec dropped by more than SLOWDOWN_TOLERANCE against a previous run."""
+    baseline_cases = {(case["name"], case["path"]): case for case in baseline["cases"]}
+    regressions = []
+    for case in current["cases"]:
+        previous = baseline_cases.get((case["name"], case["path"]))
+        if not previous or not previous.get("pages_per_second") or not case.get("pages_per_second"):
+            continue
+        if min(case["seconds"], previous["seconds"]) < MIN_COMPARABLE_SECONDS:
+            continue
+        ratio = case["pages_per_second"] / previous["pages_per_second"]
+        if ratio < 1 - SLOWDOWN_TOLERANCE:
+            regressions.append({
+                "name": case["name"],
+                "path": case["path"],
+                "previous_pages_per_second": previous["pages_per_second"],
+                "pages_per_second": case["pages_per_second"],
+            })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark and regression harness for extract.py")
+    parser.add_argument("--synthetic", default=",".join(str(n) for n in SYNTHETIC_PAGE_COUNTS),
+                        help="comma-separated page counts of the generated PDFs (empty for none)")
+    parser.add_argument("--output", help="write the results JSON to this file instead of stdout")
+    parser.add_argument("--baseline", help="results JSON of a previous run to compare throughput against")
+    parser.add_argument("--update-golden", action="store_true", help="store the current outlines of the sample PDFs as golden files")
+    parser.add_argument("--no-batch", action="store_true", help="skip the batch (process pool) run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as synthetic_dir:
+        cases = []
+        for name in SAMPLE_PDFS:
+            pdf_path = os.path.join(INPUT_DIR, name)
+            golden_path = os.path.join(GOLDEN_DIR, os.path.splitext(name)[0] + ".json")
+            cases.append({"name": name, "pdf": pdf_path, "path": "single", "golden": golden_path})
+            cases.append({"name": name, "pdf": pdf_path, "path": "chunked"})
+            cases.append({"name": name, "pdf": pdf_path, "path": "low_memory", "golden": golden_path})
+
+        for page_count in [int(n) for n in args.synthetic.split(",") if n.strip()]:
+            pdf_path = os.path.join(synthetic_dir, f"synthetic_{page_count}.pdf")
+            generate_synthetic_pdf(pdf_path, page_count)
+            cases.append({"name": os.path.basename(pdf_path), "pdf": pdf_path, "path": "single"})
+            cases.append({"name": os.path.basename(pdf_path), "pdf": pdf_path, "path": "chunked"})
+            cases.append({"name": os.path.basename(pdf_path), "pdf": pdf_path, "path": "low_memory"})
+
+        # One fresh process per case so that peak RSS is measured per case
+        case_results = []
+        with multiprocessing.get_context("spawn").Pool(processes=1, maxtasksperchild=1) as pool:
+            for case in cases:
+                result, outline = pool.apply(benchmark_case, (case,))
+                case_results.append(result)
+
+                if args.update_golden and case.get("golden"):
+                    os.makedirs(GOLDEN_DIR, exist_ok=True)
+                    with open(case["golden"], "w", encoding="utf-8") as f:
+                        json.dump(outline, f, indent=4, ensure_ascii=False)
+
+        if not args.no_batch:
+            case_results.append(benchmark_batch([case["pdf"] for case in cases if case["path"] == "single"]))
+
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pymupdf": getattr(fitz, "VersionBind", None),
+        "font_info": hasattr(fitz, 'TEXT_FONT_INFO'),
+        "extractor_version": extract.EXTRACTOR_VERSION,
+        "config_fingerprint": extract.CONFIG_FINGERPRINT,
+        "cases": case_results,
+    }
+
+    exit_code = 0
+    if any(case.get("golden", {}).get("match") is False for case in case_results):
+        exit_code = 1
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            results["regressions"] = compare_runs(results, json.load(f))
+        if results["regressions"]:
+            exit_code = 1
+
+    output = json.dumps(results, indent=4, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"✅ Benchmark results saved to {args.output}")
+    else:
+        print(output)
+
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,30 @@
 import fitz
-import uuid
+import asyncio
+import contextlib
+import cProfile
+import hashlib
+import sqlite3
+import zlib
+import concurrent.futures
 import re
 import json
 import os
 import sys
+import time
+import urllib.parse
 from datetime import datetime
 from collections import Counter
+from http import HTTPStatus
+
+try:
+    import numpy as np
+except ImportError: # NumPy is optional: classify_headings falls back to per-line classification
+    np = None
+
+try:
+    import resource
+except ImportError: # Not available on Windows: peak RSS is not reported there
+    resource = None
 
 
 ARABIC_NUMERAL_PATTERN = re.compile(r"^((\d+)(\.\d+)*)\s+")
@@ -25,6 +44,16 @@ SPECIAL_SECTION_PATTERNS = [
     (re.compile(r"^\s*(?:[\d\W_]*\s*)?(Conclusion|Conclusions)\s*[:\s]?.*", re.IGNORECASE), "H2"),
 ]
 
+# Matches whenever any of the patterns above matches; used to skip the individual checks for plain body lines
+ANY_HEADING_PATTERN = re.compile("|".join(
+    f"(?i:{pattern.pattern})" if pattern.flags & re.IGNORECASE else f"(?:{pattern.pattern})"
+    for pattern in [ARABIC_NUMERAL_PATTERN, PARENTHESIZED_NUMERAL_PATTERN]
+    + [pattern for pattern, _ in JAPANESE_HEADING_PATTERNS]
+    + [pattern for pattern, _ in SPECIAL_SECTION_PATTERNS]
+))
+
+HEADING_LEVELS = ["H1", "H2", "H3", "H4", "H5"]
+
 HEADING_FONT_DELTAS = {
     "H1": 6,
     "H2": 3,
@@ -43,34 +72,662 @@ ALL_CAPS_BOOST = -2
 
 X0_TOLERANCE = 5
 
-def analyze_font_sizes_and_x0(doc):
+HEADER_FOOTER_PAGES = 10 # Number of leading pages always checked for recurring headers/footers
+
+HEADER_FOOTER_SAMPLE_PAGES = 50 # Number of pages spread over the rest of the document also checked for them
+
+HEADER_FOOTER_MAX_KEYS = 4096 # Distinct header/footer candidates counted at once
+
+DIGITS_PATTERN = re.compile(r"\d+")
+
+PROFILE_SAMPLE_PAGES = 50 # Default number of pages sampled by the statistics phase
+
+HEADING_BATCH_LINES = 4096 # Candidate lines classified together in one classify_headings call
+
+BATCH_CHUNK_PAGES = 100 # PDFs longer than this are split into page ranges in batch mode
+
+STYLE_SAMPLE_PAGES = 3 # Leading pages whose fonts make up a document's style fingerprint
+
+STYLE_MIN_DOCUMENTS = 2 # Documents of a style that must agree before its stored statistics are reused
+
+TIME_BUDGET_STATISTICS_SHARE = 0.25 # Share of a time budget that a sampled statistics phase may take
+
+LOW_MEMORY_STORE_SHRINK_PAGES = 25 # In low-memory mode, MuPDF's object store is emptied every this many pages
+
+LOW_MEMORY_REOPEN_PAGES = 250 # In low-memory mode, a PDF file is reopened every this many pages to drop its parsed objects
+
+SERVICE_PORT = 8765 # Default port of the --serve HTTP service
+
+SERVICE_QUEUE_SIZE = 32 # Requests waiting for a pool process beyond this are rejected with 503
+
+SERVICE_MAX_UPLOAD_BYTES = 200 * 1024 * 1024 # Largest request body the service accepts
+
+BOOKMARK_MIN_ENTRIES = 2 # Fewer embedded bookmarks than this are not trusted as an outline
+BOOKMARK_MIN_VALID_RATIO = 0.9 # Share of bookmarks that must have a title and a valid page
+BOOKMARK_MAX_LEVEL = 4 # Deeper bookmark levels are reported as H4
+
+METADATA_FILENAME_TITLE_PATTERN = re.compile(r"(\.(docx?|pdf|txt|rtf|indd|pptx?)$)|^Microsoft (Word|PowerPoint) - ", re.IGNORECASE)
+
+PDF_REFERENCE_PATTERN = re.compile(r"(\d+) \d+ R\b") # Indirect reference in an object's source, e.g. "12 0 R"
+
+PDF_PARENT_PATTERN = re.compile(r"/Parent \d+ \d+ R\b") # Link back up the page tree, not followed when hashing resources
+
+class ExtractionMetrics:
     """
-    Analyzes the document to find the most common font size and x0 position.
-    This helps in determining the body text font size and the common left margin.
+    Per-stage timers and counters for one extraction, see collect_metrics.
+    Stages: layout, font_analysis, header_footer, title, heading_loop.
+    Counters: pages, blocks, lines, spans, candidate_lines, headings, cache hits/misses and
+    pattern_<family> for each heading-pattern family that decided a line's level.
     """
-    font_sizes_counts = Counter()
-    x0_counts = Counter()
 
-    use_font_info_local = hasattr(fitz, 'TEXT_FONT_INFO')
+    def __init__(self):
+        self.stage_seconds = Counter()
+        self.counters = Counter()
+        self.profile_path = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        stage_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[name] += time.perf_counter() - stage_start
+
+    def to_dict(self):
+        result = {
+            "stage_seconds": {name: round(seconds, 6) for name, seconds in self.stage_seconds.items()},
+            "counters": dict(self.counters),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        if self.profile_path:
+            result["cprofile"] = self.profile_path
+        return result
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far in MB, or None where it can't be measured."""
+    try:
+        # Unlike ru_maxrss, VmHWM does not carry the parent's peak over into a spawned child
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    return round(usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024, 1)
+
+
+_active_metrics = None # ExtractionMetrics being collected, if any
+
+@contextlib.contextmanager
+def collect_metrics(cprofile_path=None):
+    """
+    Collects ExtractionMetrics for everything extracted inside the with block.
+    If cprofile_path is given, the block also runs under cProfile and the stats are dumped there.
+    Instrumentation is off (and costs a single check per call site) outside of this block.
+    """
+    global _active_metrics
+    previous_metrics = _active_metrics
+    metrics = ExtractionMetrics()
+    _active_metrics = metrics
+
+    profiler = None
+    if cprofile_path:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield metrics
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(cprofile_path)
+            metrics.profile_path = cprofile_path
+        _active_metrics = previous_metrics
+
+
+def _stage(name):
+    """Times a stage when metrics are being collected."""
+    return _active_metrics.stage(name) if _active_metrics is not None else contextlib.nullcontext()
+
+
+def _count(name, amount=1):
+    """Increments a counter when metrics are being collected."""
+    if _active_metrics is not None:
+        _active_metrics.counters[name] += amount
+
+
+EXTRACTOR_VERSION = "2" # Bump when a change to the extraction logic alters its output
+
+# Changes whenever one of the heuristic constants changes, so that cached results are not reused across configurations
+CONFIG_FINGERPRINT = hashlib.sha1(json.dumps([
+    HEADING_FONT_DELTAS, BOLD_FONT_ADJUSTMENT, LARGE_SPACE_MULTIPLIER, VERY_LARGE_SPACE_MULTIPLIER,
+    VERY_LARGE_SPACE_ADJUSTMENT, ALL_CAPS_BOOST, X0_TOLERANCE, HEADER_FOOTER_PAGES,
+    HEADER_FOOTER_SAMPLE_PAGES,
+    ANY_HEADING_PATTERN.pattern,
+], sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+CACHE_MAX_BYTES = int(os.environ.get("OUTLINE_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+
+class OutlineCache:
+    """
+    Size-bounded LRU cache of extraction results, stored in a SQLite file inside cache_dir.
+    Values are JSON-serializable objects stored zlib-compressed. When the total stored size
+    exceeds max_bytes, the least recently used entries are evicted.
+    Safe to share between processes: each process opens its own connection.
+    """
+
+    def __init__(self, cache_dir, max_bytes=CACHE_MAX_BYTES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "outline_cache.sqlite3")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, key):
+        """Returns the cached value for key, or None."""
+        row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            _count("cache_misses")
+            return None
+
+        self.hits += 1
+        _count("cache_hits")
+        self._conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key, value):
+        """Stores value under key and evicts old entries if the cache grew too large."""
+        blob = zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        self._conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+            (key, blob, len(blob), time.time()))
+        self._total_bytes += len(blob)
+
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def update(self, key, update):
+        """
+        Replaces the value under key with update(value), where value is None if key is missing, in one
+        transaction so that processes updating the same entry don't lose each other's changes.
+        If update returns None the entry is left as it is.
+        """
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            value = update(None if row is None else json.loads(zlib.decompress(row[0])))
+            if value is not None:
+                self.put(key, value)
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _evict(self):
+        """Deletes least recently used entries until the cache fits in max_bytes."""
+        # Other processes may have written or evicted entries since we last looked
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if self._total_bytes <= self.max_bytes:
+            return
+
+        expired_keys = []
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY last_used"):
+            if self._total_bytes <= self.max_bytes:
+                break
+            expired_keys.append((key,))
+            self._total_bytes -= size
+
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", expired_keys)
+
+    def close(self):
+        self._conn.close()
+
+
+_open_caches = {} # cache_dir -> OutlineCache, one connection per process
+
+def open_cache(cache_dir):
+    """Returns the OutlineCache for cache_dir, opening it once per process. Returns None if cache_dir is empty."""
+    if not cache_dir:
+        return None
+    if cache_dir not in _open_caches:
+        _open_caches[cache_dir] = OutlineCache(cache_dir)
+    return _open_caches[cache_dir]
+
+
+class HeadingIndex:
+    """
+    Corpus-wide index of extracted headings, stored in a SQLite file.
+    Each document's outline replaces its previous one, so the index can be updated as files are processed.
+    Heading text is searchable with SQLite's FTS5 full-text search (with a LIKE scan where FTS5 is missing),
+    and the (level, page) and document lookups go through ordinary indexes.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, title TEXT, source_mtime REAL, indexed_at REAL NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS headings ("
+            "id INTEGER PRIMARY KEY, document_id INTEGER NOT NULL, level INTEGER NOT NULL, page INTEGER NOT NULL, text TEXT NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS headings_level_page ON headings (level, page)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS headings_document ON headings (document_id, page)")
+        try:
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS headings_fts USING fts5("
+                "text, content='headings', content_rowid='id', tokenize='unicode61 remove_diacritics 2')")
+            self.full_text = True
+        except sqlite3.OperationalError: # SQLite built without FTS5
+            self.full_text = False
+
+    def add(self, name, result, source_mtime=None):
+        """Replaces the indexed outline of the document called name with the outline of result."""
+        with self._transaction():
+            row = self._conn.execute("SELECT id FROM documents WHERE name = ?", (name,)).fetchone()
+            if row is not None:
+                self._delete_headings(row[0])
+                self._conn.execute("UPDATE documents SET title = ?, source_mtime = ?, indexed_at = ? WHERE id = ?",
+                                   (result.get("title", ""), source_mtime, time.time(), row[0]))
+                document_id = row[0]
+            else:
+                document_id = self._conn.execute(
+                    "INSERT INTO documents (name, title, source_mtime, indexed_at) VALUES (?, ?, ?, ?)",
+                    (name, result.get("title", ""), source_mtime, time.time())).lastrowid
+
+            self._conn.executemany(
+                "INSERT INTO headings (document_id, level, page, text) VALUES (?, ?, ?, ?)",
+                [(document_id, int(heading["level"][1:]), heading["page"], heading["text"]) for heading in result["outline"]])
+            if self.full_text:
+                self._conn.execute("INSERT INTO headings_fts (rowid, text) SELECT id, text FROM headings WHERE document_id = ?", (document_id,))
+
+    def _delete_headings(self, document_id):
+        if self.full_text:
+            # External-content FTS tables are told which rows go away with the special 'delete' command
+            self._conn.execute(
+                "INSERT INTO headings_fts (headings_fts, rowid, text) SELECT 'delete', id, text FROM headings WHERE document_id = ?",
+                (document_id,))
+        self._conn.execute("DELETE FROM headings WHERE document_id = ?", (document_id,))
+
+    def source_mtime(self, name):
+        """Returns the source_mtime stored with the document called name, or None."""
+        row = self._conn.execute("SELECT source_mtime FROM documents WHERE name = ?", (name,)).fetchone()
+        return row and row[0]
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def query(self, text=None, level=None, first_page=None, last_page=None, document=None, limit=100, documents_only=False):
+        """
+        Returns the headings matching every given filter, as {"document", "title", "level", "text", "page"} dicts
+        in document and page order. text matches whole words of the heading text in that order (an FTS5 phrase);
+        level is "H2" or 2; first_page and last_page are inclusive.
+        With documents_only, returns one {"document", "title", "matches"} dict per matching document instead.
+        """
+        conditions = []
+        params = []
+        source = "headings h"
+        if text:
+            if self.full_text:
+                source = "headings_fts JOIN headings h ON h.id = headings_fts.rowid"
+                conditions.append("headings_fts MATCH ?")
+                params.append('"' + text.replace('"', '""') + '"')
+            else:
+                conditions.append("h.text LIKE ?")
+                params.append(f"%{text}%")
+        if level is not None:
+            conditions.append("h.level = ?")
+            params.append(int(str(level).upper().lstrip("H")))
+        if first_page is not None:
+            conditions.append("h.page >= ?")
+            params.append(first_page)
+        if last_page is not None:
+            conditions.append("h.page <= ?")
+            params.append(last_page)
+        if document is not None:
+            conditions.append("d.name = ?")
+            params.append(document)
+
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        if documents_only:
+            sql = (f"SELECT d.name, d.title, COUNT(*) FROM {source} JOIN documents d ON d.id = h.document_id{where}"
+                   " GROUP BY d.id ORDER BY d.name LIMIT ?")
+            return [{"document": name, "title": title, "matches": matches}
+                    for name, title, matches in self._conn.execute(sql, params + [limit])]
+
+        sql = (f"SELECT d.name, d.title, h.level, h.text, h.page FROM {source} JOIN documents d ON d.id = h.document_id{where}"
+               " ORDER BY d.name, h.page, h.id LIMIT ?")
+        rows = self._conn.execute(sql, params + [limit])
+        return [{"document": name, "title": title, "level": f"H{level}", "text": text, "page": page}
+                for name, title, level, text, page in rows]
+
+    def close(self):
+        self._conn.close()
+
+
+_open_indexes = {} # path -> HeadingIndex, one connection per process
+
+def open_index(path):
+    """Returns the HeadingIndex stored at path, opening it once per process. Returns None if path is empty."""
+    if not path:
+        return None
+    if path not in _open_indexes:
+        _open_indexes[path] = HeadingIndex(path)
+    return _open_indexes[path]
+
+
+def index_output_dir(index, output_dir):
+    """
+    Adds the outline JSON files of output_dir (e.g. from a Go orchestrator run) to the index.
+    Files whose modification time matches the indexed one are skipped. Returns the number of files indexed.
+    """
+    indexed = 0
+    for file_name in sorted(os.listdir(output_dir)):
+        if not file_name.endswith(".json"):
+            continue
+        path = os.path.join(output_dir, file_name)
+        mtime = os.path.getmtime(path)
+        name = os.path.splitext(file_name)[0] + ".pdf"
+        if index.source_mtime(name) == mtime:
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+            index.add(name, result, mtime)
+            indexed += 1
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"⚠️ Skipping {file_name}: {e}")
+    return indexed
+
+
+_file_hashes = {} # (path, size, mtime) -> content hash, so a file is read once per process
+
+def pdf_content_hash(pdf):
+    """
+    Returns the SHA-256 of the PDF's bytes for a file path or a bytes buffer.
+    Returns None for an already-open fitz.Document.
+    """
+    if isinstance(pdf, fitz.Document):
+        return None
+    if isinstance(pdf, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(pdf).hexdigest()
+
+    stat = os.stat(pdf)
+    memo_key = (os.path.abspath(pdf), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _file_hashes:
+        digest = hashlib.sha256()
+        with open(pdf, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        _file_hashes[memo_key] = digest.hexdigest()
+    return _file_hashes[memo_key]
+
+
+def page_content_hash(page):
+    """
+    Hashes what determines a page's extracted text: its content streams, its size and its resources.
+    The resources are hashed by value, following their references to fonts and form XObjects (see pdf_object_hash),
+    so identical pages get the same hash even across documents, pages appended to or left untouched in an
+    edited document keep theirs, and pages drawing different objects under the same name get different ones.
+    """
+    digest = hashlib.sha1(page.read_contents())
+    digest.update(repr(tuple(page.rect)).encode("utf-8"))
+
+    # Resources may be inherited from the page tree
+    doc = page.parent
+    xref = page.xref
+    kind, resources = doc.xref_get_key(xref, "Resources")
+    while kind == "null":
+        kind, parent = doc.xref_get_key(xref, "Parent")
+        if kind != "xref":
+            break
+        xref = int(parent.split()[0])
+        kind, resources = doc.xref_get_key(xref, "Resources")
+
+    # Object hashes are kept on the document so shared fonts and forms are hashed once per document
+    if not hasattr(doc, "_outline_object_hashes"):
+        doc._outline_object_hashes = {}
+    digest.update(_hash_pdf_references(doc, resources, doc._outline_object_hashes, set()).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def pdf_object_hash(doc, xref, hashes, active):
+    """
+    Hashes a PDF object by value: its source with every reference replaced by the hash of the referenced
+    object, plus its raw stream unless it is an image (images draw no text). The numbers objects happen to get
+    in the file do not matter. hashes memoizes results by xref; active holds the objects being hashed, which
+    break reference cycles.
+    """
+    if xref in hashes:
+        return hashes[xref]
+    if xref in active:
+        return "cycle"
+    active.add(xref)
+    source = doc.xref_object(xref, compressed=True)
+    digest = hashlib.sha1(_hash_pdf_references(doc, source, hashes, active).encode("utf-8"))
+    if doc.xref_is_stream(xref) and "/Subtype/Image" not in source:
+        digest.update(doc.xref_stream_raw(xref) or b"")
+    active.discard(xref)
+    hashes[xref] = digest.hexdigest()
+    return hashes[xref]
+
+
+def _hash_pdf_references(doc, source, hashes, active):
+    """Replaces the references in an object's source by the hashes of the objects, except the link to a parent."""
+    xref_count = doc.xref_length()
+
+    def replace(match):
+        xref = int(match.group(1))
+        return pdf_object_hash(doc, xref, hashes, active) if 0 < xref < xref_count else match.group(0)
+
+    return PDF_REFERENCE_PATTERN.sub(replace, PDF_PARENT_PATTERN.sub("", source))
+
+
+def _outline_cache_key(kind, content_hash, pdf_name, *params):
+    """Builds a cache key for a document-level result."""
+    parts = [kind, EXTRACTOR_VERSION, CONFIG_FINGERPRINT, content_hash, os.path.basename(pdf_name or "")]
+    return ":".join(parts + [json.dumps(param, sort_keys=True) for param in params])
+
+
+def page_has_text_layer(page):
+    """
+    Cheap check run before the full text extraction of a page.
+    Returns False only if the page cannot contain any text, e.g. a scanned page that only draws images:
+    its content streams have no text objects and it has no annotations or form XObjects that could
+    draw text of their own. Pages of non-PDF documents are always assumed to have text.
+    """
+    if not page.parent.is_pdf:
+        return True
+    if page.first_annot is not None or page.first_widget is not None:
+        return True
+    # Inline image data may contain these bytes too; that only costs a full extraction
+    if b"BT" in page.read_contents():
+        return True
+    return bool(page.get_xobjects())
+
+
+def extract_page_blocks(page, use_font_info):
+    """
+    Extracts the text of a single page into compact block/line records.
+    Each page is parsed with get_text("dict") exactly once; every later stage
+    (font statistics, header/footer detection, title and heading detection)
+    reads these records instead of re-parsing the page.
+    Pages without a text layer are not parsed at all and give no blocks. Without font info,
+    lines only keep their text and bbox since the span sizes, bold flags and x0 positions are never read.
+    With font info, the span-by-span analysis only runs on lines that have empty spans; otherwise the
+    line's size and x0 are those of all its spans.
+    """
+    _count("pages")
+    if not page_has_text_layer(page):
+        # Image-only blocks never contribute a line to any stage, so an empty page is equivalent
+        _count("scanned_pages")
+        return []
+
+    if use_font_info:
+        raw_blocks = page.get_text("dict", flags=fitz.TEXT_FONT_INFO)["blocks"]
+    else:
+        raw_blocks = page.get_text("dict")["blocks"]
+
+    if _active_metrics is not None:
+        _active_metrics.counters["blocks"] += len(raw_blocks)
+        for block in raw_blocks:
+            for line in block.get("lines", ()):
+                _active_metrics.counters["lines"] += 1
+                _active_metrics.counters["spans"] += len(line["spans"])
+
+    blocks = []
+    for block in raw_blocks:
+        if "lines" not in block:
+            # Keep non-text blocks as placeholders: they still count towards the top/bottom blocks of a page
+            blocks.append({"bbox": tuple(block["bbox"]), "lines": None, "max_size": 0})
+            continue
+
+        if not use_font_info:
+            lines = [_plain_line_record(line) for line in block["lines"]]
+            blocks.append({"bbox": tuple(block["bbox"]), "lines": lines, "max_size": 0})
+            continue
+
+        lines = []
+        for line in block["lines"]:
+            spans = line["spans"]
+            span_texts = [span["text"].strip() for span in spans]
+            span_sizes = [span["size"] for span in spans]
+            raw_text = " ".join(span_texts).strip()
+            max_span_size = max(span_sizes, default=0)
+            first_x0 = spans[0]["bbox"][0] if spans else None
+
+            if all(span_texts):
+                # No empty spans: the line's size and x0 are those of all its spans
+                text = raw_text
+                max_font_size_in_line = max_span_size
+                x0_position_in_line = first_x0
+                is_line_bold = any(span["flags"] & 1 for span in spans) # Check for bold flag
+            else:
+                text_parts = []
+                max_font_size_in_line = 0
+                is_line_bold = False
+                x0_position_in_line = None
+                for span, span_text in zip(spans, span_texts):
+                    if span_text:
+                        text_parts.append(span_text)
+                        max_font_size_in_line = max(max_font_size_in_line, span["size"])
+                        if (span["flags"] & 1): # Check for bold flag
+                            is_line_bold = True
+                        if x0_position_in_line is None:
+                            x0_position_in_line = span["bbox"][0]
+                text = " ".join(text_parts).strip()
+
+            lines.append({
+                "text": text, # Text of the non-empty spans
+                "raw_text": raw_text, # Text of all spans, as used for headers/footers and title
+                "size": max_font_size_in_line, # Largest font size among non-empty spans
+                "bold": is_line_bold,
+                "x0": x0_position_in_line, # x0 of the first non-empty span
+                "span_sizes": [round(size, 1) for size in span_sizes],
+                "max_span_size": max_span_size,
+                "first_x0": first_x0,
+                "bbox": tuple(line["bbox"]),
+            })
+
+        blocks.append({
+            "bbox": tuple(block["bbox"]),
+            "lines": lines,
+            "max_size": max((line["max_span_size"] for line in lines), default=0),
+        })
+
+    return blocks
+
+
+def _plain_line_record(line):
+    """Line record without the font fields, for documents processed without font info."""
+    span_texts = [span["text"].strip() for span in line["spans"]]
+    return {
+        "text": " ".join([span_text for span_text in span_texts if span_text]),
+        "raw_text": " ".join(span_texts).strip(),
+        "bbox": tuple(line["bbox"]),
+    }
+
+
+def extract_document_layout(doc, use_font_info, start_page=0, end_page=None, cache=None):
+    """
+    Extracts the block/line records of the pages [start_page, end_page) of the document,
+    one list of blocks per page. end_page defaults to the end of the document.
+    """
+    end_page = len(doc) if end_page is None else min(end_page, len(doc))
+    return extract_pages_layout(doc, range(start_page, end_page), use_font_info, cache)
+
+
+def extract_pages_layout(doc, page_numbers, use_font_info, cache=None):
+    """
+    Extracts the block/line records of the given pages.
+    With a cache, pages whose content hash was seen before are not parsed again.
+    """
+    with _stage("layout"):
+        if cache is None:
+            return [extract_page_blocks(doc[page_num], use_font_info) for page_num in page_numbers]
+
+        return _extract_pages_layout_cached(doc, page_numbers, use_font_info, cache)
 
-    for page_num in range(len(doc)):
+
+def _extract_pages_layout_cached(doc, page_numbers, use_font_info, cache):
+    """extract_pages_layout with a cache: pages are looked up by content hash before being parsed."""
+    layout = []
+    for page_num in page_numbers:
         page = doc[page_num]
-        if use_font_info_local:
-            # Get text blocks with font information
-            blocks = page.get_text("dict", flags=fitz.TEXT_FONT_INFO)["blocks"]
-        else:
-            # If TEXT_FONT_INFO is not available, return None for font size and x0
-            return None, None
+        key = f"page:{EXTRACTOR_VERSION}:{int(use_font_info)}:{page_content_hash(page)}"
+        blocks = cache.get(key)
+        if blocks is None:
+            blocks = extract_page_blocks(page, use_font_info)
+            cache.put(key, blocks)
+        layout.append(blocks)
+    return layout
+
+
+def analyze_font_sizes_and_x0(layout):
+    """
+    Analyzes the document layout to find the most common font size and x0 position.
+    This helps in determining the body text font size and the common left margin.
+    """
+    font_sizes_counts = Counter()
+    x0_counts = Counter()
 
+    for blocks in layout:
         for block in blocks:
-            if "lines" not in block:
+            if block["lines"] is None:
                 continue
             for line in block["lines"]:
-                for span in line["spans"]:
-                    # Round font sizes to 1 decimal place for better grouping
-                    font_sizes_counts[round(span["size"], 1)] += 1
+                # Font sizes are already rounded to 1 decimal place for better grouping
+                font_sizes_counts.update(line["span_sizes"])
                 # Use the x0 of the first span in the line for x0 position
-                x0_counts[round(line["spans"][0]["bbox"][0], 1)] += 1
+                if line["first_x0"] is not None:
+                    x0_counts[round(line["first_x0"], 1)] += 1
 
     # Get the most common font size and x0 position
     most_common_font_size = font_sizes_counts.most_common(1)[0][0] if font_sizes_counts else None
@@ -110,7 +767,7 @@ def get_heading_level(text, font_size=None, is_bold=False, body_text_font_size=N
         very_large_space_threshold = body_text_font_size * VERY_LARGE_SPACE_MULTIPLIER
 
         # Iterate through heading levels to infer based on font size
-        for level_key in ["H1", "H2", "H3", "H4", "H5"]:
+        for level_key in HEADING_LEVELS:
             delta = HEADING_FONT_DELTAS[level_key]
             threshold = body_text_font_size + delta
 
@@ -139,9 +796,18 @@ def get_heading_level(text, font_size=None, is_bold=False, body_text_font_size=N
                 inferred_level_by_font = level_key
                 break
 
+    return _resolve_heading_level(text_stripped, inferred_level_by_font)
+
+
+def _resolve_heading_level(text_stripped, inferred_level_by_font):
+    """
+    Combines the font-inferred level of a line with the numbering and keyword patterns.
+    Shared by get_heading_level and classify_headings.
+    """
     # Check for Arabic numeral patterns (e.g., 1, 1.1, 1.1.1)
     match_arabic = ARABIC_NUMERAL_PATTERN.match(text_stripped)
     if match_arabic:
+        _count("pattern_arabic")
         # Calculate depth based on number of dots
         calculated_depth = match_arabic.group(1).count('.') + 1
         clean_text = text_stripped[len(match_arabic.group(0)):].strip()
@@ -156,6 +822,7 @@ def get_heading_level(text, font_size=None, is_bold=False, body_text_font_size=N
     # Check for parenthesized numeral patterns (e.g., (1), (a))
     match_parenthesized = PARENTHESIZED_NUMERAL_PATTERN.match(text_stripped)
     if match_parenthesized:
+        _count("pattern_parenthesized")
         clean_text = match_parenthesized.group(2).strip()
         level_from_parenthesized = "H3" # Default to H3 for parenthesized items
 
@@ -168,6 +835,7 @@ def get_heading_level(text, font_size=None, is_bold=False, body_text_font_size=N
     for pattern, pattern_level in JAPANESE_HEADING_PATTERNS:
         match_japanese = pattern.match(text_stripped)
         if match_japanese:
+            _count("pattern_japanese")
             clean_text = text_stripped
             level_from_japanese = pattern_level
             # Prioritize font-based inference if it suggests a higher level
@@ -179,332 +847,1786 @@ def get_heading_level(text, font_size=None, is_bold=False, body_text_font_size=N
     for pattern, pattern_level in SPECIAL_SECTION_PATTERNS:
         match_special = pattern.match(text_stripped)
         if match_special:
+            _count("pattern_special")
             clean_text = match_special.group(1).strip()
             return (pattern_level, clean_text)
 
     # If a level was inferred by font, apply additional checks for validity
     if inferred_level_by_font:
+        _count("pattern_font")
         return (inferred_level_by_font, text_stripped)
 
     return (None, None)
 
-def extract_pdf_outline(pdf_path):
+def infer_font_levels(font_sizes, bold_flags, spaces_above, x0_positions, all_caps_flags, body_text_font_size, min_x0_doc):
     """
-    Extracsts the outline (table of contents) from a PDF document.
-    It identifies headings based on font properties, numbering patterns, and content.
+    Vectorized version of the font-based part of get_heading_level.
+    Takes one value per line in each column and returns, per line, the index into HEADING_LEVELS
+    of the inferred level, or -1 if the font does not suggest a heading.
+    The thresholds are built with the same sequence of operations as get_heading_level so that
+    both give bit-identical results.
     """
-    try:
-        doc = fitz.open(pdf_path)
-    except fitz.FileDataError:
-        print(f"Error: Could not open PDF file at {pdf_path}. Please check the path and file integrity.")
-        return {"title": os.path.splitext(os.path.basename(pdf_path))[0].replace("_", " ").title(), "outline": []}
+    line_count = len(font_sizes)
+    if body_text_font_size is None or line_count == 0:
+        return np.full(line_count, -1)
+
+    sizes = np.array(font_sizes, dtype=float)
+    spaces = np.array([np.nan if space is None else space for space in spaces_above], dtype=float)
+
+    large_space_threshold = body_text_font_size * LARGE_SPACE_MULTIPLIER
+    very_large_space_threshold = body_text_font_size * VERY_LARGE_SPACE_MULTIPLIER
+
+    thresholds = np.array([body_text_font_size + HEADING_FONT_DELTAS[level_key] for level_key in HEADING_LEVELS])
+
+    # One row per line, one column per heading level
+    effective_thresholds = thresholds[None, :] + np.where(np.asarray(bold_flags, dtype=bool), BOLD_FONT_ADJUSTMENT, 0)[:, None]
+    effective_thresholds = effective_thresholds + np.where(
+        spaces > very_large_space_threshold, VERY_LARGE_SPACE_ADJUSTMENT,
+        np.where(spaces > large_space_threshold, -1, 0))[:, None]
+    effective_thresholds = effective_thresholds + np.where(np.asarray(all_caps_flags, dtype=bool), ALL_CAPS_BOOST, 0)[:, None]
+
+    if min_x0_doc is not None:
+        x0s = np.array([np.nan if x0 is None else x0 for x0 in x0_positions], dtype=float)
+        aligned = np.abs(x0s - min_x0_doc) < X0_TOLERANCE
+        # The left-margin adjustment only applies to H1 and H2
+        effective_thresholds[:, :2] = effective_thresholds[:, :2] - aligned[:, None]
+
+    meets_threshold = sizes[:, None] >= effective_thresholds
+    return np.where(meets_threshold.any(axis=1), meets_threshold.argmax(axis=1), -1)
+
+
+def classify_headings(texts, font_sizes, bold_flags, spaces_above, x0_positions, body_text_font_size, min_x0_doc):
+    """
+    Classifies a batch of lines (e.g. a whole page) at once.
+    Returns one (level, cleaned_text) tuple per line, identical to calling get_heading_level on each line.
+    The font-based levels are computed in one vectorized pass; the pattern checks only run on lines
+    that either have a font-inferred level or can match one of the heading patterns.
+    Falls back to per-line get_heading_level when NumPy is not available.
+    """
+    if np is None:
+        return [
+            get_heading_level(text, font_size, is_bold, body_text_font_size, space_above, x0_position, min_x0_doc)
+            for text, font_size, is_bold, space_above, x0_position
+            in zip(texts, font_sizes, bold_flags, spaces_above, x0_positions)
+        ]
+
+    texts_stripped = [text.strip() for text in texts]
+    all_caps_flags = [is_all_caps(text) for text in texts_stripped]
+    level_indexes = infer_font_levels(font_sizes, bold_flags, spaces_above, x0_positions, all_caps_flags, body_text_font_size, min_x0_doc)
+
+    results = []
+    for text_stripped, level_index in zip(texts_stripped, level_indexes.tolist()):
+        inferred_level_by_font = HEADING_LEVELS[level_index] if level_index >= 0 else None
+        if inferred_level_by_font is None and not ANY_HEADING_PATTERN.match(text_stripped):
+            _count("prefilter_skipped")
+            results.append((None, None))
+        else:
+            results.append(_resolve_heading_level(text_stripped, inferred_level_by_font))
+    return results
+
+
+def get_heading_level_from_patterns(text):
+    """
+    Determines the heading level of a given text from numbering and keyword patterns only.
+    Used when font information is not available.
+    """
+    is_valid_heading = None
+    cleaned_text = None
+
+    match_arabic = ARABIC_NUMERAL_PATTERN.match(text)
+    if match_arabic:
+        _count("pattern_arabic")
+        calculated_depth = match_arabic.group(1).count('.') + 1
+        is_valid_heading = f"H{calculated_depth}" if 1 <= calculated_depth <= 5 else None
+        cleaned_text = text[len(match_arabic.group(0)):].strip()
+
+    if not is_valid_heading:
+        match_parenthesized = PARENTHESIZED_NUMERAL_PATTERN.match(text)
+        if match_parenthesized:
+            _count("pattern_parenthesized")
+            is_valid_heading = "H3" # Default to H3 for parenthesized items if no font info
+            cleaned_text = match_parenthesized.group(2).strip()
+
+    if not is_valid_heading:
+        for pattern, level in JAPANESE_HEADING_PATTERNS:
+            if pattern.match(text):
+                _count("pattern_japanese")
+                is_valid_heading = level
+                cleaned_text = text.strip()
+                break
+
+    if not is_valid_heading:
+        for pattern, level in SPECIAL_SECTION_PATTERNS:
+            match_special = pattern.match(text)
+            if match_special:
+                _count("pattern_special")
+                is_valid_heading = level
+                cleaned_text = match_special.group(1).strip()
+                break
+
+    if not is_valid_heading:
+        # Simple heuristic for potential headings without font info
+        if 5 < len(text) < 50 and text[0].isupper() and not '.' in text:
+            _count("pattern_heuristic")
+            is_valid_heading = "H1"
+            cleaned_text = text.strip()
+        else:
+            is_valid_heading = None
+            cleaned_text = None
+
+    return is_valid_heading, cleaned_text
+
+
+def header_footer_key(text, normalize_digits=False):
+    """
+    Key under which a line is counted as a header/footer candidate, as an 8-byte digest in hex.
+    With normalize_digits, every run of digits is replaced by "#" first, so that "Page 3 of 12"
+    and "Page 4 of 12" count together.
+    """
+    if normalize_digits:
+        text = DIGITS_PATTERN.sub("#", text)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
 
+
+def is_header_footer(text, excluded_keys):
+    """Checks whether a line matches one of the header/footer keys, as is or with its digits normalized."""
+    if not excluded_keys or len(text) <= 5: # Shorter lines are never counted as headers/footers
+        return False
+    return header_footer_key(text) in excluded_keys or header_footer_key(text, normalize_digits=True) in excluded_keys
+
+
+class HeaderFooterDetector:
+    """
+    Counts the top- and bottom-band lines (those of the first and last 2 blocks by vertical position) of the
+    pages it observes, at most once per page. Lines are counted with their digits normalized (see header_footer_key),
+    which catches running headers and footers with page numbers, except for lines starting with a section number:
+    numbered headings at the top of every page must not all look like one recurring line.
+    The counts are bounded to max_keys keys; past that, the rarest keys are dropped.
+    A key seen on at least half of the observed pages, or on at least half of the first HEADER_FOOTER_PAGES
+    of them (documents made of several parts have their own headers in each), is a header/footer.
+    Pages must be observed in page order.
+    """
+
+    def __init__(self, max_keys=HEADER_FOOTER_MAX_KEYS):
+        self.counts = Counter()
+        self.head_counts = Counter()
+        self.pages = 0
+        self.max_keys = max_keys
+
+    def observe(self, blocks):
+        self.pages += 1
+        blocks = sorted(blocks, key=lambda b: b["bbox"][1]) # Sort blocks by their vertical position
+
+        page_keys = set()
+        for block in blocks[:2] + blocks[max(2, len(blocks) - 2):]: # Top 2 and bottom 2 blocks
+            if block["lines"] is not None:
+                for line in block["lines"]:
+                    text = line["raw_text"]
+                    if text and len(text) > 5:
+                        page_keys.add(header_footer_key(text, normalize_digits=not ARABIC_NUMERAL_PATTERN.match(text)))
+        self.counts.update(page_keys)
+        if self.pages <= HEADER_FOOTER_PAGES:
+            self.head_counts.update(page_keys)
+
+        if len(self.counts) > self.max_keys:
+            rarest = min(self.counts.values())
+            for key in [key for key, count in self.counts.items() if count == rarest]:
+                del self.counts[key]
+
+    def excluded_keys(self):
+        """Returns the keys of the recurring headers/footers."""
+        head_pages = min(self.pages, HEADER_FOOTER_PAGES)
+        return ({key for key, count in self.counts.items() if count >= self.pages * 0.5}
+                | {key for key, count in self.head_counts.items() if count >= head_pages * 0.5})
+
+
+def detect_headers_footers(layout):
+    """
+    Identifies recurring header/footer lines from the pages of the layout, looking at the first
+    HEADER_FOOTER_PAGES pages and HEADER_FOOTER_SAMPLE_PAGES more spread over the rest (see header_footer_pages).
+    Returns the set of header_footer_key keys to exclude from the outline.
+    """
+    detector = HeaderFooterDetector()
+    for page_index in header_footer_pages(len(layout)):
+        detector.observe(layout[page_index])
+    return detector.excluded_keys()
+
+
+def header_footer_pages(page_count):
+    """Offsets of the pages of a range of page_count pages that header/footer detection looks at."""
+    return sample_page_numbers(page_count, HEADER_FOOTER_SAMPLE_PAGES)
+
+
+def detect_title(first_page_blocks, excluded_keys, use_font_info):
+    """
+    Attempts to extract the main title from the blocks of the first page.
+    Returns None if no suitable title is found.
+    """
     extracted_title = None
-    all_detected_headings = [] # Temporarily store all detected headings for sorting later
-    seen_titles = set() # To avoid duplicate entries in the outline
+    extracted_title_candidates = []
 
-    use_font_info = hasattr(fitz, 'TEXT_FONT_INFO') # Check if font info is available in fitz
+    # Sort by font size descending, then y0 for title candidates
+    first_page_blocks = sorted(first_page_blocks, key=lambda b: (-b["max_size"] if use_font_info and b["lines"] else 0, b["bbox"][1]))
+
+    for block in first_page_blocks:
+        if block["lines"] is None:
+            continue
+        for line in block["lines"]:
+            if line["raw_text"]:
+                extracted_title_candidates.append({
+                    "text": line["raw_text"],
+                    "font_size": max(0, line["max_span_size"]) if use_font_info else 0,
+                    "y0": line["bbox"][1],
+                    "y1": line["bbox"][3]
+                })
+
+    # Sort title candidates primarily by font size (descending) then by y-position
+    extracted_title_candidates.sort(key=lambda x: (-x["font_size"], x["y0"]))
+
+    if extracted_title_candidates:
+        # Try to combine multiple lines for the main title
+        main_title_parts = []
+        if use_font_info and extracted_title_candidates[0]["font_size"] > 0:
+            # Set a threshold for what constitutes a "large" font size for the title
+            # This could be the largest font size, or a certain delta from the body text size
+            title_font_size_threshold = extracted_title_candidates[0]["font_size"] - 2 # Allow slight variations
+
+            prev_y1 = -1
+            for candidate in extracted_title_candidates:
+                if is_header_footer(candidate["text"], excluded_keys):
+                    continue
+
+                # Only consider lines that are large enough and relatively close to the previous line
+                if candidate["font_size"] >= title_font_size_threshold and \
+                   (prev_y1 == -1 or (candidate["y0"] - prev_y1) < (candidate["font_size"] * 2)): # Heuristic for vertical proximity
+                    main_title_parts.append(candidate["text"])
+                    prev_y1 = candidate["y1"]
+                elif main_title_parts: # Stop if we encounter a line that's not part of the title block
+                    break
+
+            if main_title_parts:
+                extracted_title = " ".join(main_title_parts).strip()
+
+        # Fallback if combining lines didn't yield a title, or if font info isn't available
+        if extracted_title is None:
+            for candidate in extracted_title_candidates:
+                if is_header_footer(candidate["text"], excluded_keys):
+                    continue
+                if 10 < len(candidate["text"]) < 200:
+                    extracted_title = candidate["text"]
+                    break
+
+    return extracted_title
 
+
+def compute_document_profile(layout, use_font_info, pdf_name="", font_statistics=None, excluded_keys=None):
+    """
+    Computes the document-wide statistics used for heading classification from a layout:
+    body text font size, dominant x0, excluded header/footer keys and the title.
+    The layout must start with the first page of the document (or of the range being processed).
+    font_statistics, the result of analyze_font_sizes_and_x0 over more pages than the layout holds,
+    replaces the font analysis of the layout; excluded_keys, from a HeaderFooterDetector that observed
+    such pages, replaces the header/footer detection.
+    """
     body_text_font_size = None
     min_x0_doc = None
-    if use_font_info:
+    if font_statistics is not None:
+        body_text_font_size, min_x0_doc = font_statistics
+    elif use_font_info:
         # Analyze font sizes and x0 positions across the document to set baselines
-        body_text_font_size, min_x0_doc = analyze_font_sizes_and_x0(doc)
-
-    potential_footers_headers = Counter()
-    pages_to_check_for_footers = min(len(doc), 10) # Check first few pages for recurring headers/footers
+        with _stage("font_analysis"):
+            body_text_font_size, min_x0_doc = analyze_font_sizes_and_x0(layout)
 
     # Identify common headers/footers to exclude from outline
-    for page_num in range(pages_to_check_for_footers):
-        page = doc[page_num]
-        if use_font_info:
-            blocks = page.get_text("dict", flags=fitz.TEXT_FONT_INFO)["blocks"]
-        else:
-            blocks = page.get_text("dict")["blocks"]
+    if excluded_keys is None:
+        with _stage("header_footer"):
+            excluded_keys = detect_headers_footers(layout)
 
-        blocks.sort(key=lambda b: b["bbox"][1]) # Sort blocks by their vertical position
+    # Attempt to extract the main title from the first page
+    with _stage("title"):
+        extracted_title = detect_title(layout[0], excluded_keys, use_font_info) if layout else None
 
-        top_lines = []
-        bottom_lines = []
+    # Fallback title if no title is extracted
+    if extracted_title is None:
+        extracted_title = default_title(pdf_name)
 
-        # Collect lines from the top and bottom of the page
-        for block in blocks[:min(len(blocks), 2)]: # Check top 2 blocks
-            if "lines" in block:
-                for line in block["lines"]:
-                    line_text = " ".join([span["text"].strip() for span in line["spans"]]).strip()
-                    if line_text and len(line_text) > 5:
-                        top_lines.append(line_text)
-
-        for block in blocks[max(0, len(blocks)-2):]: # Check bottom 2 blocks
-            if "lines" in block:
-                for block_line in block["lines"]:
-                    line_text = " ".join([span["text"].strip() for span in block_line["spans"]]).strip()
-                    if line_text and len(line_text) > 5:
-                        bottom_lines.append(line_text)
-
-        for text in top_lines + bottom_lines:
-            potential_footers_headers[text] += 1
-
-    excluded_texts = set()
-    for text, count in potential_footers_headers.items():
-        # If a text appears on more than 50% of the checked pages, exclude it
-        if count >= pages_to_check_for_footers * 0.5:
-            excluded_texts.add(text)
+    return {
+        "body_text_font_size": body_text_font_size,
+        "min_x0_doc": min_x0_doc,
+        "excluded_keys": sorted(excluded_keys),
+        "title": extracted_title,
+    }
 
-    # Attempt to extract the main title from the first page
-    extracted_title_candidates = []
-    if len(doc) > 0:
-        first_page = doc[0]
-        if use_font_info:
-            first_page_blocks = first_page.get_text("dict", flags=fitz.TEXT_FONT_INFO)["blocks"]
+
+def sample_page_numbers(page_count, max_pages=PROFILE_SAMPLE_PAGES, strategy="uniform"):
+    """
+    Chooses which pages the statistics phase looks at.
+    The first HEADER_FOOTER_PAGES pages are always included (header/footer and title detection need them);
+    the remaining budget is spent according to the strategy:
+      "all"     - every page
+      "head"    - the first max_pages pages
+      "uniform" - max_pages pages spread evenly over the document
+    """
+    if strategy == "all" or max_pages is None or page_count <= max_pages:
+        return list(range(page_count))
+
+    page_numbers = set(range(min(page_count, HEADER_FOOTER_PAGES)))
+    if strategy == "head":
+        page_numbers.update(range(max_pages))
+    elif strategy == "uniform":
+        step = page_count / max_pages
+        page_numbers.update(int(i * step) for i in range(max_pages))
+    else:
+        raise ValueError(f"Unknown sampling strategy: {strategy}")
+
+    return sorted(page_numbers)
+
+
+def build_document_profile(pdf_path, max_pages=PROFILE_SAMPLE_PAGES, strategy="uniform", cache=None, style_profiles=False):
+    """
+    Runs the statistics phase once for a whole document and returns its profile.
+    The profile is JSON-serializable so that chunk workers can share it instead of
+    each recomputing (and disagreeing on) the statistics from their own pages.
+    The sample always includes the pages header/footer detection looks at in a single pass, so the
+    profile excludes the same headers and footers.
+    With style_profiles and a cache, a document whose style has a trusted style profile only has its
+    first pages parsed (see profile_from_style); other documents add their statistics to their style's profile.
+    """
+    use_font_info = hasattr(fitz, 'TEXT_FONT_INFO')
+    cache_key = None
+    if cache is not None:
+        content_hash = pdf_content_hash(pdf_path)
+        if content_hash is not None:
+            pdf_name = pdf_path if isinstance(pdf_path, str) else ""
+            cache_key = _outline_cache_key("profile", content_hash, pdf_name, max_pages, strategy, use_font_info, style_profiles)
+            profile = cache.get(cache_key)
+            if profile is not None:
+                return profile
+
+    doc, pdf_name, owns_doc = open_pdf(pdf_path)
+    try:
+        fingerprint, style_profile = document_style(doc, cache) if style_profiles else (None, None)
+        if style_profile is not None:
+            page_numbers = list(range(min(len(doc), HEADER_FOOTER_PAGES)))
+            layout = extract_pages_layout(doc, page_numbers, use_font_info, cache)
+            profile = profile_from_style(layout, use_font_info, pdf_name, style_profile)
         else:
-            first_page_blocks = first_page.get_text("dict")["blocks"]
+            # Header/footer detection looks at the same pages as a single pass over the whole document
+            detected_pages = set(header_footer_pages(len(doc)))
+            page_numbers = sorted(set(sample_page_numbers(len(doc), max_pages, strategy)) | detected_pages)
+            layout = extract_pages_layout(doc, page_numbers, use_font_info, cache)
+            with _stage("header_footer"):
+                detector = HeaderFooterDetector()
+                for page_num, blocks in zip(page_numbers, layout):
+                    if page_num in detected_pages:
+                        detector.observe(blocks)
+            profile = compute_document_profile(layout, use_font_info, pdf_name, excluded_keys=detector.excluded_keys())
+            if fingerprint is not None:
+                record_style_profile(cache, fingerprint, doc, profile)
+        profile["page_count"] = len(doc)
+        profile["sampled_pages"] = len(page_numbers)
+    finally:
+        if owns_doc:
+            doc.close()
 
-        # Sort by font size descending, then y0 for title candidates
-        first_page_blocks.sort(key=lambda b: (-max([s["size"] for l in b.get("lines", []) for s in l["spans"]]) if use_font_info and b.get("lines") else 0, b["bbox"][1]))
+    if cache_key is not None:
+        cache.put(cache_key, profile)
+    return profile
 
-        for block in first_page_blocks:
-            if "lines" not in block:
-                continue
-            for line in block["lines"]:
-                line_text = " ".join([span["text"].strip() for span in line["spans"]]).strip()
-                if line_text:
-                    max_font_size = 0
-                    if use_font_info:
-                        for span in line["spans"]:
-                            max_font_size = max(max_font_size, span["size"])
-
-                    extracted_title_candidates.append({
-                        "text": line_text,
-                        "font_size": max_font_size,
-                        "y0": line["bbox"][1],
-                        "y1": line["bbox"][3]
-                    })
 
-        # Sort title candidates primarily by font size (descending) then by y-position
-        extracted_title_candidates.sort(key=lambda x: (-x["font_size"], x["y0"]))
+def style_fingerprint(doc, start_page=0):
+    """
+    Fingerprints the style of a document: its producer and creator metadata, the size of its first page and
+    the fonts used on its first STYLE_SAMPLE_PAGES pages (from the page resources, without parsing any text).
+    Documents generated from the same template share a fingerprint.
+    """
+    metadata = doc.metadata or {}
+    fonts = Counter()
+    for page_num in range(start_page, min(len(doc), start_page + STYLE_SAMPLE_PAGES)):
+        for font in doc.get_page_fonts(page_num):
+            fonts[f"{font[3].split('+')[-1]}/{font[2]}"] += 1 # Base font without its subset prefix, and font type
+    page_size = [round(value) for value in doc[start_page].rect[2:]] if start_page < len(doc) else []
 
-        if extracted_title_candidates:
-            # Try to combine multiple lines for the main title
-            main_title_parts = []
-            if use_font_info and extracted_title_candidates[0]["font_size"] > 0:
-                # Set a threshold for what constitutes a "large" font size for the title
-                # This could be the largest font size, or a certain delta from the body text size
-                title_font_size_threshold = extracted_title_candidates[0]["font_size"] - 2 # Allow slight variations
+    style = [metadata.get("producer", ""), metadata.get("creator", ""), page_size, sorted(fonts.items()), hasattr(fitz, 'TEXT_FONT_INFO')]
+    return hashlib.sha1(json.dumps(style).encode("utf-8")).hexdigest()[:16]
 
-                prev_y1 = -1
-                for candidate in extracted_title_candidates:
-                    if candidate["text"] in excluded_texts:
-                        continue
 
-                    # Only consider lines that are large enough and relatively close to the previous line
-                    if candidate["font_size"] >= title_font_size_threshold and \
-                       (prev_y1 == -1 or (candidate["y0"] - prev_y1) < (candidate["font_size"] * 2)): # Heuristic for vertical proximity
-                        main_title_parts.append(candidate["text"])
-                        prev_y1 = candidate["y1"]
-                    elif main_title_parts: # Stop if we encounter a line that's not part of the title block
-                        break
+def find_style_profile(cache, fingerprint):
+    """
+    Returns the stored statistics of a style, {"body_text_font_size", "min_x0_doc", "excluded_keys"},
+    once at least STYLE_MIN_DOCUMENTS different documents of that style were seen and all of them had the same
+    body font size and x0. Returns None otherwise.
+    """
+    entry = cache.get(_outline_cache_key("style", fingerprint, ""))
+    if entry is None or len(entry["documents"]) < STYLE_MIN_DOCUMENTS or len(entry["statistics"]) != 1:
+        return None
+
+    body_text_font_size, min_x0_doc = json.loads(next(iter(entry["statistics"])))
+    _count("style_profile_hits")
+    return {
+        "body_text_font_size": body_text_font_size,
+        "min_x0_doc": min_x0_doc,
+        # Headers/footers of the template itself, not those of single documents
+        "excluded_keys": [key for key, documents in entry["excluded_keys"].items() if documents >= len(entry["documents"]) * 0.5],
+    }
 
-                if main_title_parts:
-                    extracted_title = " ".join(main_title_parts).strip()
 
-            # Fallback if combining lines didn't yield a title, or if font info isn't available
-            if extracted_title is None:
-                for candidate in extracted_title_candidates:
-                    if candidate["text"] in excluded_texts:
-                        continue
-                    if 10 < len(candidate["text"]) < 200:
-                        extracted_title = candidate["text"]
-                        break
+def record_style_profile(cache, fingerprint, doc, profile):
+    """
+    Adds the statistics of the profile of an open document to the stored profile of its style.
+    Documents are told apart by content hash, so an in-memory document (which has none) is not recorded.
+    A document already recorded, or a style whose documents disagree (which is never trusted), is left as it is.
+    """
+    if not doc.name:
+        return
+    document_hash = pdf_content_hash(doc.name)
+    statistics = json.dumps([profile["body_text_font_size"], profile["min_x0_doc"]])
 
-    # Fallback title if no title is extracted
+    def add_document(entry):
+        entry = entry or {"documents": [], "statistics": {}, "excluded_keys": {}}
+        if len(entry["statistics"]) > 1 or document_hash in entry["documents"]:
+            return None
+        entry["documents"].append(document_hash)
+        entry["statistics"][statistics] = entry["statistics"].get(statistics, 0) + 1
+        for excluded_key in profile["excluded_keys"]:
+            entry["excluded_keys"][excluded_key] = entry["excluded_keys"].get(excluded_key, 0) + 1
+        return entry
+
+    cache.update(_outline_cache_key("style", fingerprint, ""), add_document)
+
+
+def covers_whole_document(doc, start_page, end_page):
+    """Checks whether the pages [start_page, end_page) are all the pages of the document."""
+    return start_page == 0 and (end_page is None or end_page >= len(doc))
+
+
+def document_style(doc, cache, start_page=0, end_page=None):
+    """
+    Returns the style fingerprint of a document and its stored style profile (None until the style is trusted).
+    Style profiles describe whole documents, so a run over a page range gets (None, None).
+    """
+    if cache is None or not covers_whole_document(doc, start_page, end_page):
+        return None, None
+    fingerprint = style_fingerprint(doc)
+    return fingerprint, find_style_profile(cache, fingerprint)
+
+
+def profile_from_style(head_layout, use_font_info, pdf_name, style_profile):
+    """
+    compute_document_profile without the statistics pass: the font statistics come from a stored style profile,
+    and the excluded keys are the style's plus those found on the head_layout (the document's first
+    HEADER_FOOTER_PAGES pages), which also gives the title.
+    """
+    excluded_keys = set(style_profile["excluded_keys"]) | detect_headers_footers(head_layout)
+    font_statistics = (style_profile["body_text_font_size"], style_profile["min_x0_doc"])
+    return compute_document_profile(head_layout, use_font_info, pdf_name, font_statistics, excluded_keys)
+
+
+def load_document_profile(profile_path):
+    """Loads a profile written by --profile."""
+    with open(profile_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def default_title(pdf_path):
+    """Builds a fallback title from the file name of the PDF."""
+    return os.path.splitext(os.path.basename(pdf_path or ""))[0].replace("_", " ").title()
+
+
+def open_pdf(pdf):
+    """
+    Opens a PDF given as a file path, a bytes buffer or an already-open fitz.Document.
+    Returns the document, its path (empty for in-memory documents) and whether the caller owns it and must close it.
+    """
+    if isinstance(pdf, fitz.Document):
+        return pdf, pdf.name, False
+    if isinstance(pdf, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=bytes(pdf), filetype="pdf"), "", True
+    return fitz.open(pdf), pdf, True
+
+
+def bookmarks_look_usable(toc, page_count):
+    """
+    Quality check for embedded bookmarks: there must be at least BOOKMARK_MIN_ENTRIES of them,
+    and nearly all of them must have a title and point to an existing page.
+    """
+    if len(toc) < BOOKMARK_MIN_ENTRIES:
+        return False
+    valid_entries = [entry for entry in toc if entry[1].strip() and 1 <= entry[2] <= page_count]
+    return len(valid_entries) >= len(toc) * BOOKMARK_MIN_VALID_RATIO
+
+
+def metadata_title(doc):
+    """Returns the title from the document metadata, ignoring empty titles and leftover file names."""
+    title = " ".join(((doc.metadata or {}).get("title") or "").split())
+    if not title or METADATA_FILENAME_TITLE_PATTERN.search(title):
+        return None
+    return title
+
+
+def outline_from_bookmarks(doc, pdf_name="", start_page=0, end_page=None):
+    """
+    Converts the document's embedded bookmarks (doc.get_toc()) into the outline JSON shape.
+    Bookmark levels deeper than H4 are reported as H4; entries are ordered by page.
+    The title comes from the metadata, else from the first page, else from the file name.
+    Returns None when there are no bookmarks or they fail bookmarks_look_usable.
+    """
+    toc = doc.get_toc(simple=True)
+    if not bookmarks_look_usable(toc, len(doc)):
+        return None
+
+    end_page = len(doc) if end_page is None else min(end_page, len(doc))
+    outline = []
+    for level, text, page in toc:
+        text = " ".join(text.split())
+        if text and start_page < page <= end_page:
+            outline.append({"level": f"H{min(level, BOOKMARK_MAX_LEVEL)}", "text": text, "page": page})
+    outline.sort(key=lambda heading: heading["page"])
+
+    extracted_title = metadata_title(doc)
+    if extracted_title is None and len(doc) > 0:
+        use_font_info = hasattr(fitz, 'TEXT_FONT_INFO')
+        extracted_title = detect_title(extract_page_blocks(doc[0], use_font_info), set(), use_font_info)
     if extracted_title is None:
-        extracted_title = os.path.splitext(os.path.basename(pdf_path))[0].replace("_", " ").title()
+        extracted_title = default_title(pdf_name)
+
+    return {
+        "title": extracted_title,
+        "outline": outline
+    }
+
+
+def bookmark_outline(pdf_path):
+    """
+    Returns the page count of a PDF and the outline made from its embedded bookmarks (see outline_from_bookmarks),
+    or None as the outline when the bookmarks are unusable. Large documents are checked this way before they are
+    profiled, so that a document with usable bookmarks is not split into page ranges.
+    """
+    doc, pdf_name, owns_doc = open_pdf(pdf_path)
+    try:
+        return len(doc), outline_from_bookmarks(doc, pdf_name)
+    finally:
+        if owns_doc:
+            doc.close()
+
+
+def extract_pdf_outline(pdf_path, start_page=0, end_page=None, profile=None, cache=None, use_bookmarks=False, time_budget=None, low_memory=False,
+                        style_profiles=False, doc=None):
+    """
+    Extracsts the outline (table of contents) from a PDF document.
+    It identifies headings based on font properties, numbering patterns, and content.
+    pdf_path may also be a bytes buffer or an already-open fitz.Document.
+    Only the pages [start_page, end_page) are processed; page numbers in the outline
+    stay absolute (1-indexed within the whole document).
+    If a profile from build_document_profile is given, its statistics are used instead of
+    being recomputed from the pages in the range.
+    With an OutlineCache, an unchanged document is answered from the cache after hashing it,
+    and only pages that are not in the cache are parsed.
+    With use_bookmarks, the document's embedded bookmarks are used as the outline when they pass
+    a quality check, and no layout analysis is done at all.
+    With a time_budget in seconds, the extraction degrades step by step when it is about to run
+    over budget (see TimeBudget); the result then lists the steps taken under "degraded".
+    With low_memory, pages are not kept in memory after they are processed (see _extract_outline_low_memory);
+    the result is the same. A time_budget takes precedence.
+    With style_profiles, documents produced from the same template share their statistics through the cache
+    (see build_document_profile). Without a profile, whole-document runs record their statistics, and only
+    low-memory runs use a style's statistics instead of computing their own.
+    A caller that already opened pdf_path may pass the document as doc; pdf_path is then only used for the cache key.
+    """
+    budget = TimeBudget(time_budget) if time_budget else None
+    cache_key = None
+    if cache is not None:
+        content_hash = pdf_content_hash(pdf_path)
+        if content_hash is not None:
+            pdf_name = pdf_path if isinstance(pdf_path, str) else ""
+            cache_key = _outline_cache_key("outline", content_hash, pdf_name, start_page, end_page, profile, hasattr(fitz, 'TEXT_FONT_INFO'), use_bookmarks, style_profiles)
+            result = cache.get(cache_key)
+            if result is not None:
+                return result
+
+    try:
+        doc, pdf_name, owns_doc = open_pdf(pdf_path if doc is None else doc)
+    except fitz.FileDataError:
+        print(f"Error: Could not open PDF file at {pdf_path}. Please check the path and file integrity.")
+        return {"title": default_title(pdf_path if isinstance(pdf_path, str) else ""), "outline": []}
+
+    try:
+        result = outline_from_bookmarks(doc, pdf_name, start_page, end_page) if use_bookmarks else None
+        if result is None:
+            result = _extract_outline_from_doc(doc, pdf_name, start_page, end_page, profile, cache, budget, low_memory, style_profiles)
+    finally:
+        if owns_doc:
+            doc.close()
+
+    # A degraded result depends on how fast this run happened to be, so it is not reused
+    if cache_key is not None and "degraded" not in result:
+        cache.put(cache_key, result)
+    return result
+
+
+def _extract_outline_from_doc(doc, pdf_name, start_page, end_page, profile, cache=None, budget=None, low_memory=False, style_profiles=False):
+    """Runs the outline extraction over the pages [start_page, end_page) of an open document."""
+    if budget is not None:
+        return _extract_outline_within_budget(doc, pdf_name, start_page, end_page, profile, cache, budget)
+    if low_memory:
+        return _extract_outline_low_memory(doc, pdf_name, start_page, end_page, profile, cache, style_profiles)
+
+    use_font_info = hasattr(fitz, 'TEXT_FONT_INFO') # Check if font info is available in fitz
+
+    # Parse every page exactly once; all stages below read from this layout
+    layout = extract_document_layout(doc, use_font_info, start_page, end_page, cache)
+
+    if profile is None:
+        # No precomputed profile: derive the statistics from the pages being processed
+        profile = compute_document_profile(layout, use_font_info, pdf_name)
+        # Every page is parsed for the headings anyway, so a style profile is not used here, only recorded
+        if style_profiles and cache is not None and covers_whole_document(doc, start_page, end_page):
+            record_style_profile(cache, style_fingerprint(doc), doc, profile)
 
-    # Initialize the outline list here
     outline = []
-    # Main loop to extract outline entries from each page
-    for page_num in range(len(doc)):
-        page = doc[page_num]
+    for page_headings in iter_page_headings(layout, start_page, profile, use_font_info):
+        outline.extend(page_headings)
+
+    return {
+        "title": profile["title"],
+        "outline": outline
+    }
+
+
+class HashedTitleSet:
+    """
+    Set of heading texts that stores an 8-byte digest per text instead of the text itself,
+    used as the dedup state in low-memory mode.
+    """
 
-        prev_line_bbox_y1_on_page = None # To calculate space between lines
+    def __init__(self):
+        self.digests = set()
+
+    @staticmethod
+    def _digest(text):
+        return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def __contains__(self, text):
+        return self._digest(text) in self.digests
+
+    def add(self, text):
+        self.digests.add(self._digest(text))
+
+
+def iter_pages_low_memory(doc, page_numbers, use_font_info, cache=None):
+    """
+    Yields the blocks of the given pages one page at a time, keeping nothing between pages:
+    the page object and its text dict are released once the page's blocks are built, and
+    MuPDF's object store (fonts, images, decoded streams) is emptied every LOW_MEMORY_STORE_SHRINK_PAGES pages.
+    MuPDF also keeps every PDF object it parsed until the document is closed, so a document opened
+    from a file is read through a fresh copy every LOW_MEMORY_REOPEN_PAGES pages.
+    """
+    current_doc = doc
+    try:
+        for index, page_num in enumerate(page_numbers, 1):
+            yield extract_pages_layout(current_doc, [page_num], use_font_info, cache)[0]
+            if index % LOW_MEMORY_REOPEN_PAGES == 0 and doc.name:
+                if current_doc is not doc:
+                    current_doc.close()
+                current_doc = fitz.open(doc.name)
+                _count("document_reopens")
+            if index % LOW_MEMORY_STORE_SHRINK_PAGES == 0:
+                fitz.TOOLS.store_shrink(100)
+                _count("store_shrinks")
+    finally:
+        if current_doc is not doc:
+            current_doc.close()
+
+
+def _extract_outline_low_memory(doc, pdf_name, start_page, end_page, profile, cache, style_profiles=False):
+    """
+    _extract_outline_from_doc without holding the layout of the whole range.
+    Only the first HEADER_FOOTER_PAGES pages are kept, for title detection. With font info, the font statistics
+    need every page before the first heading can be classified, so the pages are read twice: once for the
+    statistics and header/footer detection and once for the headings. Without it, only the pages header/footer
+    detection looks at are read ahead. Headings are deduplicated by digest. A trusted style profile (style_profiles)
+    replaces the first pass, leaving only the head pages to read ahead.
+    """
+    use_font_info = hasattr(fitz, 'TEXT_FONT_INFO')
+    end_page = len(doc) if end_page is None else min(end_page, len(doc))
+    page_numbers = range(start_page, end_page)
+
+    head_pages = []
+    fingerprint, style_profile = document_style(doc, cache, start_page, end_page) if style_profiles and profile is None else (None, None)
+    if style_profile is not None:
+        head_pages.extend(iter_pages_low_memory(doc, page_numbers[:HEADER_FOOTER_PAGES], use_font_info, cache))
+        profile = profile_from_style(head_pages, use_font_info, pdf_name, style_profile)
+    elif profile is None:
+        detector = HeaderFooterDetector()
+        detected_offsets = header_footer_pages(len(page_numbers))
+        detected_offset_set = set(detected_offsets)
+
+        def pages_keeping_head(offsets):
+            for offset, blocks in zip(offsets, iter_pages_low_memory(doc, [page_numbers[offset] for offset in offsets], use_font_info, cache)):
+                if offset < HEADER_FOOTER_PAGES:
+                    head_pages.append(blocks)
+                if offset in detected_offset_set:
+                    detector.observe(blocks)
+                yield blocks
 
         if use_font_info:
-            blocks = page.get_text("dict", flags=fitz.TEXT_FONT_INFO)["blocks"]
+            with _stage("font_analysis"):
+                font_statistics = analyze_font_sizes_and_x0(pages_keeping_head(range(len(page_numbers))))
         else:
-            blocks = page.get_text("dict")["blocks"]
+            # Only the pages header/footer detection looks at are read ahead
+            for _ in pages_keeping_head(detected_offsets):
+                pass
+            font_statistics = None
+        profile = compute_document_profile(head_pages, use_font_info, pdf_name, font_statistics, detector.excluded_keys())
+        if fingerprint is not None:
+            record_style_profile(cache, fingerprint, doc, profile)
+
+    # The kept head pages are classified without being parsed again
+    remaining_pages = page_numbers[len(head_pages):]
+
+    def page_layouts():
+        while head_pages:
+            yield head_pages.pop(0)
+        yield from iter_pages_low_memory(doc, remaining_pages, use_font_info, cache)
 
-        for block in blocks:
-            if "lines" not in block:
-                continue
-            for line in block["lines"]:
-                line_text_parts = []
-                max_font_size_in_line = 0
-                is_line_bold = False
-                x0_position_in_line = None
+    outline = []
+    for page_headings in iter_page_headings(page_layouts(), start_page, profile, use_font_info, seen_titles=HashedTitleSet()):
+        outline.extend(page_headings)
 
-                if use_font_info:
-                    for span in line["spans"]:
-                        span_text = span["text"].strip()
-                        if span_text:
-                            line_text_parts.append(span_text)
-                            max_font_size_in_line = max(max_font_size_in_line, span["size"])
-                            if (span["flags"] & 1): # Check for bold flag
-                                is_line_bold = True
-                            if x0_position_in_line is None:
-                                x0_position_in_line = span["bbox"][0]
-                else:
-                    # Fallback for when font info is not available (only text extraction)
-                    line_text_parts = [span["text"].strip() for span in line["spans"] if span["text"].strip()]
+    return {
+        "title": profile["title"],
+        "outline": outline
+    }
+
+
+class TimeBudget:
+    """
+    Time allowed for extracting one document (--time-budget) and the degradation steps taken to stay within it,
+    in the order they are taken:
+      "sampled_statistics" - the font statistics come from a sample of the pages instead of all of them
+      "pattern_only"       - the remaining pages are classified by numbering and keyword patterns only
+      "truncated"          - the remaining pages are skipped and the outline is partial
+    The time left is compared with the time the remaining pages are expected to take, estimated
+    from the pages parsed so far.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.start = time.perf_counter()
+        self.steps = []
+        self.parsed_pages = 0
+        self.parse_seconds = 0.0
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def remaining(self):
+        return self.seconds - self.elapsed()
 
-                text = " ".join(line_text_parts).strip()
+    def projected_seconds(self, page_count):
+        """Estimated time to parse page_count more pages."""
+        if not self.parsed_pages:
+            return 0.0
+        return self.parse_seconds / self.parsed_pages * page_count
 
-                current_line_y0 = line["bbox"][1]
-                space_above_current_line = 0
-                if prev_line_bbox_y1_on_page is not None:
-                    space_above_current_line = current_line_y0 - prev_line_bbox_y1_on_page
+    def parse_page(self, doc, page_num, use_font_info, cache=None):
+        """extract_pages_layout for a single page, timed for the estimates."""
+        page_start = time.perf_counter()
+        blocks = extract_pages_layout(doc, [page_num], use_font_info, cache)[0]
+        self.parsed_pages += 1
+        self.parse_seconds += time.perf_counter() - page_start
+        return blocks
 
-                prev_line_bbox_y1_on_page = line["bbox"][3]
+    def degrade(self, step):
+        if step not in self.steps:
+            self.steps.append(step)
+            _count(f"degraded_{step}")
+
+
+def _extract_outline_within_budget(doc, pdf_name, start_page, end_page, profile, cache, budget):
+    """
+    _extract_outline_from_doc under a TimeBudget. As long as no step is needed the result is the same as without a budget.
+    The statistics phase stops after TIME_BUDGET_STATISTICS_SHARE of the budget. Without font info it only parses the
+    pages header/footer detection looks at. Pages parsed for the statistics are classified even once the rest is truncated.
+    """
+    use_font_info = hasattr(fitz, 'TEXT_FONT_INFO')
+    end_page = len(doc) if end_page is None else min(end_page, len(doc))
+    page_numbers = range(start_page, end_page)
+
+    layout = {} # Page number -> blocks of the pages parsed for the statistics
+    if profile is None:
+        # Header/footer and title detection always need the first pages
+        for page_num in page_numbers[:HEADER_FOOTER_PAGES]:
+            layout[page_num] = budget.parse_page(doc, page_num, use_font_info, cache)
+
+        # Parsing every page up front is no loss when they all fit in the budget, since the headings reuse them.
+        # A sample must not take more than its share of the budget.
+        statistics_deadline = budget.seconds * TIME_BUDGET_STATISTICS_SHARE
+        detected_offsets = header_footer_pages(len(page_numbers))
+        if not use_font_info:
+            # There are no font statistics, only header/footer detection
+            statistics_pages = [page_numbers[offset] for offset in detected_offsets if offset >= HEADER_FOOTER_PAGES]
+        elif budget.projected_seconds(len(page_numbers) - HEADER_FOOTER_PAGES) > budget.remaining():
+            budget.degrade("sampled_statistics")
+            statistics_pages = [page_numbers[offset] for offset in sample_page_numbers(len(page_numbers)) if offset >= HEADER_FOOTER_PAGES]
+        else:
+            statistics_pages = page_numbers[HEADER_FOOTER_PAGES:]
+            statistics_deadline = budget.seconds
 
-                # Skip empty lines, the extracted title, or excluded texts
-                if not text or text == extracted_title or text in excluded_texts:
+        for page_num in statistics_pages:
+            if budget.elapsed() >= statistics_deadline:
+                budget.degrade("sampled_statistics")
+                break
+            layout[page_num] = budget.parse_page(doc, page_num, use_font_info, cache)
+
+        detector = HeaderFooterDetector()
+        for offset in detected_offsets:
+            if page_numbers[offset] in layout:
+                detector.observe(layout[page_numbers[offset]])
+        profile = compute_document_profile([layout[page_num] for page_num in sorted(layout)], use_font_info, pdf_name,
+                                           excluded_keys=detector.excluded_keys())
+
+    processed_pages = 0
+
+    def page_layouts():
+        nonlocal processed_pages
+        for page_num in page_numbers:
+            blocks = layout.pop(page_num, None)
+            if blocks is None:
+                if "truncated" in budget.steps or budget.remaining() <= 0:
+                    # Skipped pages are empty; the ones already parsed for the statistics are still classified
+                    budget.degrade("truncated")
+                    yield []
                     continue
+                if use_font_info and budget.projected_seconds(end_page - page_num) > budget.remaining():
+                    budget.degrade("pattern_only")
+                blocks = budget.parse_page(doc, page_num, use_font_info and "pattern_only" not in budget.steps, cache)
+            processed_pages += 1
+            yield blocks
 
-                if use_font_info:
-                    # Use the comprehensive get_heading_level function with font info
-                    is_valid_heading, cleaned_text = get_heading_level(text, max_font_size_in_line, is_line_bold, body_text_font_size, space_above_current_line, x0_position_in_line, min_x0_doc)
-                else:
-                    # Fallback heading detection if font info is not available
-                    is_valid_heading = None
-                    cleaned_text = None
-
-                    match_arabic = ARABIC_NUMERAL_PATTERN.match(text)
-                    if match_arabic:
-                        calculated_depth = match_arabic.group(1).count('.') + 1
-                        is_valid_heading = f"H{calculated_depth}" if 1 <= calculated_depth <= 5 else None
-                        cleaned_text = text[len(match_arabic.group(0)):].strip()
-
-                    if not is_valid_heading:
-                        match_parenthesized = PARENTHESIZED_NUMERAL_PATTERN.match(text)
-                        if match_parenthesized:
-                            is_valid_heading = "H3" # Default to H3 for parenthesized items if no font info
-                            cleaned_text = match_parenthesized.group(2).strip()
-
-                    if not is_valid_heading:
-                        for pattern, level in JAPANESE_HEADING_PATTERNS:
-                            if pattern.match(text):
-                                is_valid_heading = level
-                                cleaned_text = text.strip()
-                                break
-
-                    if not is_valid_heading:
-                        for pattern, level in SPECIAL_SECTION_PATTERNS:
-                            match_special = pattern.match(text)
-                            if match_special:
-                                is_valid_heading = level
-                                cleaned_text = match_special.group(1).strip()
-                                break
-
-                    if not is_valid_heading:
-                        # Simple heuristic for potential headings without font info
-                        if 5 < len(text) < 50 and text[0].isupper() and not '.' in text:
-                            is_valid_heading = "H1"
-                            cleaned_text = text.strip()
-                        else:
-                            is_valid_heading = None
-                            cleaned_text = None
+    outline = []
+    for page_headings in iter_page_headings(page_layouts(), start_page, profile, use_font_info, budget):
+        outline.extend(page_headings)
+
+    result = {
+        "title": profile["title"],
+        "outline": outline
+    }
+    if budget.steps:
+        result["degraded"] = budget.steps
+    if "truncated" in budget.steps:
+        result["truncated"] = True
+        result["processed_pages"] = processed_pages
+    return result
+
+
+def heading_sort_key(item):
+    """
+    Sort key for detected headings.
+    Primary sort: page number
+    Secondary sort: heading level (H1 < H2 < H3...) - this is now a straightforward numerical sort
+    Tertiary sort: y0 position on the page
+    """
+    level_num = int(item["level"][1:]) # Convert "H1" to 1, "H2" to 2, etc.
+    return (item["page"], level_num, item["y0"])
+
+
+def iter_page_headings(layout, start_page, profile, use_font_info, budget=None, seen_titles=None):
+    """
+    Classifies the lines of each page of the layout (any iterable of per-page block lists, so pages
+    can be produced lazily) and yields one list of outline entries per page, sorted with heading_sort_key.
+    Since the page number is the primary sort key, concatenating the pages gives the sorted outline.
+    Pages are classified in batches of about HEADING_BATCH_LINES candidate lines (see classify_headings),
+    so each page's entries are yielded once its batch is complete.
+    Once a TimeBudget has taken its "pattern_only" step, the following pages are classified without font info.
+    seen_titles may be any object with add and `in` (e.g. a HashedTitleSet) to hold the dedup state.
+    """
+    seen_titles = set() if seen_titles is None else seen_titles # To avoid duplicate entries in the outline
+
+    excluded_keys = set(profile["excluded_keys"])
+    extracted_title = profile["title"]
 
+    batch = [] # (page number, candidate lines, space above each line, classify with font info) per page
+    batch_lines = 0
 
+    # Main loop to extract outline entries from each page
+    for page_num, blocks in enumerate(layout):
+        with _stage("heading_loop"):
+            prev_line_bbox_y1_on_page = None # To calculate space between lines
+            page_lines = [] # Candidate lines of this page with the space above each of them
+            page_spaces_above = []
+
+            for block in blocks:
+                if block["lines"] is None:
+                    continue
+                for line in block["lines"]:
+                    text = line["text"]
+
+                    current_line_y0 = line["bbox"][1]
+                    space_above_current_line = 0
+                    if prev_line_bbox_y1_on_page is not None:
+                        space_above_current_line = current_line_y0 - prev_line_bbox_y1_on_page
+
+                    prev_line_bbox_y1_on_page = line["bbox"][3]
+
+                    # Skip empty lines, the extracted title, or headers/footers
+                    if not text or text == extracted_title or is_header_footer(text, excluded_keys):
+                        continue
+
+                    page_lines.append(line)
+                    page_spaces_above.append(space_above_current_line)
+
+            font_info = use_font_info and not (budget is not None and "pattern_only" in budget.steps)
+            batch.append((page_num, page_lines, page_spaces_above, font_info))
+            batch_lines += len(page_lines)
+
+        if batch_lines >= HEADING_BATCH_LINES:
+            yield from _classify_page_batch(batch, start_page, profile, seen_titles)
+            batch = []
+            batch_lines = 0
+
+    yield from _classify_page_batch(batch, start_page, profile, seen_titles)
+
+
+def _classify_page_batch(batch, start_page, profile, seen_titles):
+    """
+    Classifies the candidate lines of a batch of pages of iter_page_headings and returns one list of
+    outline entries per page. The lines of all pages classified with font info go through a single
+    classify_headings call; headings are then deduplicated page by page, in page order.
+    """
+    with _stage("heading_loop"):
+        font_lines = [(line, space_above) for _, page_lines, page_spaces_above, font_info in batch if font_info
+                      for line, space_above in zip(page_lines, page_spaces_above)]
+        # Classify all lines of the batch at once with font info
+        font_levels = iter(classify_headings(
+            [line["text"] for line, _ in font_lines],
+            [line["size"] for line, _ in font_lines],
+            [line["bold"] for line, _ in font_lines],
+            [space_above for _, space_above in font_lines],
+            [line["x0"] for line, _ in font_lines],
+            profile["body_text_font_size"],
+            profile["min_x0_doc"]))
+
+        pages = []
+        for page_num, page_lines, _, font_info in batch:
+            if font_info:
+                page_levels = [next(font_levels) for _ in page_lines]
+            else:
+                # Fallback heading detection if font info is not available
+                page_levels = [get_heading_level_from_patterns(line["text"]) for line in page_lines]
+
+            detected_headings = []
+            for line, (is_valid_heading, cleaned_text) in zip(page_lines, page_levels):
                 if is_valid_heading and cleaned_text and cleaned_text not in seen_titles:
-                    # Store all detected headings temporarily with their original level and y0 for sorting
-                    all_detected_headings.append({
+                    # Store the detected headings of the page temporarily with their original level and y0 for sorting
+                    detected_headings.append({
                         "level": is_valid_heading,
                         "text": cleaned_text,
-                        "page": page_num + 1, # Convert to 1-indexed page number
+                        "page": start_page + page_num + 1, # Convert to absolute 1-indexed page number
                         "y0": line["bbox"][1] # Store y0 for sorting within a page
                     })
                     seen_titles.add(cleaned_text) # Mark as seen to avoid duplicates
 
-    # Sort all detected headings
-    # Primary sort: page number
-    # Secondary sort: heading level (H1 < H2 < H3...) - this is now a straightforward numerical sort
-    # Tertiary sort: y0 position on the page
-    def sort_key(item):
-        level_num = int(item["level"][1:]) # Convert "H1" to 1, "H2" to 2, etc.
-        return (item["page"], level_num, item["y0"])
-
-    all_detected_headings.sort(key=sort_key)
-
-    # Populate the final outline without any remapping, reflecting the sorted order directly
-    for heading_info in all_detected_headings:
-        outline.append({
-            "level": heading_info["level"], # Use the detected level directly
-            "text": heading_info["text"],
-            "page": heading_info["page"]
-        })
+            detected_headings.sort(key=heading_sort_key)
 
-    return {
-        "title": extracted_title,
-        "outline": outline
+            _count("candidate_lines", len(page_lines))
+            _count("headings", len(detected_headings))
+
+            # Populate the page's outline entries without any remapping, reflecting the sorted order directly
+            pages.append([
+                {
+                    "level": heading_info["level"], # Use the detected level directly
+                    "text": heading_info["text"],
+                    "page": heading_info["page"]
+                }
+                for heading_info in detected_headings
+            ])
+    return pages
+
+
+def iter_pdf_outline(pdf_path, start_page=0, end_page=None, profile=None, cache=None, use_bookmarks=False, low_memory=False, style_profiles=False):
+    """
+    Streaming counterpart of extract_pdf_outline.
+    Yields {"title": ...} first, then one outline entry per heading, page by page in the same
+    order as extract_pdf_outline. Pages are parsed one at a time and not kept, so memory does not
+    grow with the page count. Without a profile, the statistics come from build_document_profile,
+    which samples the document instead of reading every page up front.
+    With use_bookmarks, usable embedded bookmarks are yielded instead (see outline_from_bookmarks).
+    With low_memory, MuPDF's caches are released as pages are read and headings are deduplicated
+    by digest (see iter_pages_low_memory and HashedTitleSet).
+    """
+    use_font_info = hasattr(fitz, 'TEXT_FONT_INFO')
+
+    doc, pdf_name, owns_doc = open_pdf(pdf_path)
+    try:
+        bookmarks = outline_from_bookmarks(doc, pdf_name, start_page, end_page) if use_bookmarks else None
+        if bookmarks is not None:
+            yield {"title": bookmarks["title"]}
+            yield from bookmarks["outline"]
+            return
+
+        if profile is None:
+            profile = build_document_profile(pdf_path, cache=cache, style_profiles=style_profiles)
+
+        yield {"title": profile["title"]}
+
+        end_page = len(doc) if end_page is None else min(end_page, len(doc))
+        if low_memory:
+            page_layouts = iter_pages_low_memory(doc, range(start_page, end_page), use_font_info, cache)
+            seen_titles = HashedTitleSet()
+        else:
+            page_layouts = (extract_pages_layout(doc, [page_num], use_font_info, cache)[0] for page_num in range(start_page, end_page))
+            seen_titles = None
+        for page_headings in iter_page_headings(page_layouts, start_page, profile, use_font_info, seen_titles=seen_titles):
+            yield from page_headings
+    finally:
+        if owns_doc:
+            doc.close()
+
+
+def write_outline_jsonl(items, output):
+    """Writes the items of iter_pdf_outline to a file object as JSON Lines, flushing after each line."""
+    for item in items:
+        output.write(json.dumps(item, ensure_ascii=False) + "\n")
+        output.flush()
+
+
+def count_pages(pdf_path):
+    """Returns the number of pages in the PDF document."""
+    with fitz.open(pdf_path) as doc:
+        return len(doc)
+
+
+def handle_worker_request(request, cache=None, index=None):
+    """
+    Handles a single worker request and returns the response dict.
+    Supported operations:
+      {"op": "count", "pdf": <path>}                            -> {"ok": true, "pages": <n>}
+      {"op": "extract", "pdf": <path>}                          -> {"ok": true, "result": {...}}
+      {"op": "extract", "pdf": <path>, "start": s, "end": e}    -> {"ok": true, "result": {...}}
+      {"op": "profile", "pdf": <path>}                          -> {"ok": true, "pages": <n>, "profile": {...}}
+      {"op": "index", "pdf": <path>, "output": <json path>}     -> {"ok": true}
+    "extract" also accepts a "profile" previously returned by "profile", "bookmarks": true
+    to use usable embedded bookmarks as the outline, a "time_budget" in seconds and "low_memory": true, and "profile"
+    accepts optional "sample_pages" and "strategy" (see sample_page_numbers). Both take "style_profiles": true
+    to reuse the statistics of documents of the same style (see build_document_profile). With "bookmarks": true,
+    "profile" answers {"ok": true, "pages": <n>, "result": {...}} instead when the bookmarks are usable.
+    Results are looked up in and stored to the cache when one is given. "index" adds a finished
+    outline JSON to the HeadingIndex the worker was started with.
+    """
+    op = request.get("op")
+    pdf_path = request.get("pdf")
+    if not pdf_path:
+        raise ValueError("missing 'pdf' in request")
+
+    if op == "count":
+        return {"ok": True, "pages": count_pages(pdf_path)}
+
+    if op == "extract":
+        start_page = int(request.get("start") or 0)
+        end_page = None if request.get("end") is None else int(request["end"])
+        return {"ok": True, "result": extract_pdf_outline(pdf_path, start_page, end_page, request.get("profile"), cache,
+                                                          bool(request.get("bookmarks")), request.get("time_budget"), bool(request.get("low_memory")),
+                                                          bool(request.get("style_profiles")))}
+
+    if op == "profile":
+        if request.get("bookmarks"):
+            page_count, result = bookmark_outline(pdf_path)
+            if result is not None:
+                return {"ok": True, "pages": page_count, "result": result}
+        profile = build_document_profile(pdf_path, request.get("sample_pages", PROFILE_SAMPLE_PAGES), request.get("strategy", "uniform"), cache,
+                                         bool(request.get("style_profiles")))
+        return {"ok": True, "pages": profile["page_count"], "profile": profile}
+
+    if op == "index":
+        if index is None:
+            raise ValueError("worker was started without --index")
+        output_path = request["output"]
+        with open(output_path, "r", encoding="utf-8") as f:
+            index.add(os.path.basename(pdf_path), json.load(f), os.path.getmtime(output_path))
+        return {"ok": True}
+
+    raise ValueError(f"unknown op {op!r}")
+
+
+def iter_worker_stream(request, cache=None):
+    """
+    Handles a worker "stream" request: {"op": "stream", "pdf": <path>, "start": s, "end": e, "profile": {...}}.
+    Takes the options of "extract" except "time_budget". Yields a {"title": ...} message, one {"heading": {...}}
+    message per heading as soon as its page is classified (see iter_pdf_outline), and then the final
+    {"ok": true, "result": {"title": ...}} response.
+    """
+    pdf_path = request.get("pdf")
+    if not pdf_path:
+        raise ValueError("missing 'pdf' in request")
+
+    start_page = int(request.get("start") or 0)
+    end_page = None if request.get("end") is None else int(request["end"])
+    items = iter_pdf_outline(pdf_path, start_page, end_page, request.get("profile"), cache,
+                             bool(request.get("bookmarks")), bool(request.get("low_memory")), bool(request.get("style_profiles")))
+    title = next(items)["title"]
+    yield {"title": title}
+    for heading in items:
+        yield {"heading": heading}
+    yield {"ok": True, "result": {"title": title}}
+
+
+def serve_worker(requests_in=None, responses_out=None, cache=None, emit_metrics=False, index=None):
+    """
+    Runs the extractor as a long-lived worker: one JSON request per line on stdin,
+    one JSON response per line on stdout, until stdin is closed.
+    Keeps fitz loaded between requests so callers only pay the interpreter startup once.
+    With emit_metrics (or "metrics": true in a request) the response carries the request's metrics.
+    A "stream" request (see iter_worker_stream) writes its title and one line per heading before its response.
+    """
+    requests_in = requests_in or sys.stdin
+    responses_out = responses_out or sys.stdout
+
+    for raw_request in requests_in:
+        raw_request = raw_request.strip()
+        if not raw_request:
+            continue
+
+        request_id = None
+        try:
+            request = json.loads(raw_request)
+            request_id = request.get("id")
+            # Anything printed while extracting must not end up in the response stream
+            with contextlib.redirect_stdout(sys.stderr):
+                with collect_metrics() if emit_metrics or request.get("metrics") else contextlib.nullcontext() as metrics:
+                    if request.get("op") == "stream":
+                        for message in iter_worker_stream(request, cache):
+                            if "ok" not in message:
+                                responses_out.write(json.dumps(message, ensure_ascii=False) + "\n")
+                                responses_out.flush()
+                            else:
+                                response = message
+                    else:
+                        response = handle_worker_request(request, cache, index)
+                if metrics:
+                    response["metrics"] = metrics.to_dict()
+        except Exception as e:
+            response = {"ok": False, "error": str(e)}
+
+        if request_id is not None:
+            response["id"] = request_id
+
+        responses_out.write(json.dumps(response) + "\n")
+        responses_out.flush()
+
+
+def merge_range_outlines(results):
+    """
+    Merges the results of consecutive page ranges of one document (in range order) into one result.
+    Each range is already sorted and deduplicated; headings whose text already appeared in an
+    earlier range are dropped, matching a single pass over the whole document.
+    """
+    merged_outline = []
+    seen_titles = set()
+    degraded = []
+    for result in results:
+        for heading in result["outline"]:
+            if heading["text"] in seen_titles:
+                continue
+            seen_titles.add(heading["text"])
+            merged_outline.append(heading)
+        degraded.extend(step for step in result.get("degraded", ()) if step not in degraded)
+
+    merged = {
+        "title": results[0]["title"] if results else "",
+        "outline": merged_outline
     }
+    if degraded:
+        # Ranges degrade independently (see TimeBudget); report every step any of them took
+        merged["degraded"] = degraded
+    if any(result.get("truncated") for result in results):
+        merged["truncated"] = True
+    return merged
+
+
+def write_outline_json(result, output_file):
+    """Writes an outline result to a JSON file, creating the parent directory if needed."""
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=4, ensure_ascii=False)
+
+
+def available_cpu_count():
+    """Returns the number of CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _batch_profile_task(pdf_path, options):
+    """
+    Batch task: computes the document profile of a large PDF. With use_bookmarks, returns the finished
+    outline instead when the bookmarks are usable.
+    """
+    task_start = time.perf_counter()
+    with collect_metrics() if options["emit_metrics"] else contextlib.nullcontext() as metrics:
+        result = bookmark_outline(pdf_path)[1] if options["use_bookmarks"] else None
+        if result is None:
+            result = build_document_profile(pdf_path, cache=open_cache(options["cache_dir"]), style_profiles=options["style_profiles"])
+    return result, time.perf_counter() - task_start, metrics and metrics.to_dict()
+
+
+def _batch_extract_task(pdf_path, start_page, end_page, profile, options):
+    """Batch task: extracts the outline of a whole PDF or of one page range of it."""
+    task_start = time.perf_counter()
+    with collect_metrics() if options["emit_metrics"] else contextlib.nullcontext() as metrics:
+        result = extract_pdf_outline(pdf_path, start_page, end_page, profile, open_cache(options["cache_dir"]),
+                                     options["use_bookmarks"], options["time_budget"], options["low_memory"], options["style_profiles"])
+    return result, time.perf_counter() - task_start, metrics and metrics.to_dict()
+
+
+def merge_metrics(total, metrics):
+    """Adds the stage seconds and counters of a metrics dict (ExtractionMetrics.to_dict) into total."""
+    for section in ("stage_seconds", "counters"):
+        merged = total.setdefault(section, {})
+        for name, value in metrics.get(section, {}).items():
+            merged[name] = round(merged.get(name, 0) + value, 6)
+    if metrics.get("peak_rss_mb") is not None:
+        total["peak_rss_mb"] = max(total.get("peak_rss_mb") or 0, metrics["peak_rss_mb"])
+    return total
+
+
+def run_batch(input_dir, output_dir, workers=None, chunk_pages=BATCH_CHUNK_PAGES, cache_dir=None, emit_metrics=False, use_bookmarks=False, time_budget=None,
+              low_memory=False, index_path=None, style_profiles=False):
+    """
+    Extracts the outline of every PDF in input_dir into output_dir/<name>.json using a process pool.
+    PDFs of up to chunk_pages pages are processed as a single task; larger ones are profiled once
+    and then split into page ranges of chunk_pages pages. Work is submitted largest-first.
+    With a cache_dir, every task reads and fills the on-disk OutlineCache.
+    With emit_metrics, the metrics of each file (summed over its tasks) are printed as JSON on stderr.
+    With use_bookmarks, usable embedded bookmarks replace the layout analysis (see outline_from_bookmarks),
+    and large PDFs with usable bookmarks are not split.
+    With a time_budget, every task gets that many seconds (see TimeBudget).
+    With low_memory, tasks run in low-memory mode (see _extract_outline_low_memory).
+    With an index_path, every finished outline is also added to that HeadingIndex.
+    With style_profiles (and a cache_dir), documents of the same style share their statistics (see build_document_profile).
+    Returns a dict mapping each file name to its timing information.
+    """
+    workers = workers or available_cpu_count()
+    options = {"cache_dir": cache_dir, "emit_metrics": emit_metrics, "use_bookmarks": use_bookmarks, "time_budget": time_budget,
+               "low_memory": low_memory, "style_profiles": style_profiles} # Passed to every task
+    pdf_names = sorted(name for name in os.listdir(input_dir) if name.lower().endswith(".pdf"))
+
+    page_counts = {}
+    for name in pdf_names:
+        try:
+            page_counts[name] = count_pages(os.path.join(input_dir, name))
+        except Exception as e:
+            print(f"❌ Failed to open {name}: {e}")
+
+    pending = {} # future -> (name, kind, range index)
+    range_results = {} # name -> list of range results in page order
+    timings = {name: {"pages": page_counts[name], "tasks": 0, "task_seconds": 0.0} for name in page_counts}
+    submitted_at = {}
+    batch_start = time.perf_counter()
+
+    heading_index = open_index(index_path)
+
+    def finish(name, result):
+        write_outline_json(result, os.path.join(output_dir, os.path.splitext(name)[0] + ".json"))
+        if heading_index is not None:
+            heading_index.add(name, result)
+        timing = timings[name]
+        timing["wall_seconds"] = time.perf_counter() - submitted_at[name]
+        print(f"⏱️ {name}: {timing['pages']} pages, {timing['tasks']} task(s), "
+              f"{timing['task_seconds']:.3f}s of work, done after {timing['wall_seconds']:.3f}s")
+        if emit_metrics:
+            print(json.dumps({"pdf": name, "metrics": timing.get("metrics", {})}, ensure_ascii=False), file=sys.stderr)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        # Largest documents first so that they don't end up as the tail of the batch
+        for name in sorted(page_counts, key=lambda n: -page_counts[n]):
+            pdf_path = os.path.join(input_dir, name)
+            submitted_at[name] = time.perf_counter()
+            if page_counts[name] > chunk_pages:
+                pending[executor.submit(_batch_profile_task, pdf_path, options)] = (name, "profile", None)
+            else:
+                pending[executor.submit(_batch_extract_task, pdf_path, 0, None, None, options)] = (name, "file", None)
+
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name, kind, range_index = pending.pop(future)
+                pdf_path = os.path.join(input_dir, name)
+                try:
+                    result, elapsed, task_metrics = future.result()
+                except Exception as e:
+                    print(f"❌ Failed to extract from {name}: {e}")
+                    timings[name]["error"] = str(e)
+                    continue
+
+                timings[name]["tasks"] += 1
+                timings[name]["task_seconds"] += elapsed
+                if task_metrics:
+                    merge_metrics(timings[name].setdefault("metrics", {}), task_metrics)
+
+                if kind == "profile" and "outline" in result:
+                    # The bookmarks were usable, so the profile task already produced the outline
+                    finish(name, result)
+                elif kind == "profile":
+                    # Split the document into page ranges sharing the profile
+                    range_starts = list(range(0, page_counts[name], chunk_pages))
+                    range_results[name] = [None] * len(range_starts)
+                    for index, start_page in enumerate(range_starts):
+                        future = executor.submit(_batch_extract_task, pdf_path, start_page, start_page + chunk_pages, result, options)
+                        pending[future] = (name, "range", index)
+                elif kind == "range":
+                    range_results[name][range_index] = result
+                    if all(part is not None for part in range_results[name]):
+                        finish(name, merge_range_outlines(range_results.pop(name)))
+                else:
+                    finish(name, result)
+
+    print(f"✅ Batch of {len(page_counts)} PDFs processed in {time.perf_counter() - batch_start:.3f}s with {workers} workers")
+    return timings
+
+
+def _service_extract_task(pdf, start_page, end_page, use_bookmarks, time_budget, cache_dir):
+    """
+    Service task, run in a pool process: extracts the outline of a PDF path or of uploaded PDF bytes.
+    A document that cannot be opened raises a ServiceError for the client, since extract_pdf_outline
+    would report it as an empty outline. The opened document is handed on, so each PDF is opened once.
+    """
+    try:
+        doc, _, _ = open_pdf(pdf)
+    except RuntimeError as e: # fitz.FileDataError, fitz.FileNotFoundError, fitz.EmptyFileError
+        raise ServiceError(400, f"could not open PDF: {e}")
+    with doc:
+        return extract_pdf_outline(pdf, start_page, end_page, cache=open_cache(cache_dir), use_bookmarks=use_bookmarks, time_budget=time_budget,
+                                   doc=doc)
+
+
+class ServiceError(Exception):
+    """A request error that the service reports to the client with the given HTTP status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+    def __reduce__(self):
+        # Raised in pool processes too, so it must survive pickling
+        return ServiceError, (self.status, str(self))
+
+
+class OutlineService:
+    """
+    Local HTTP service around extract_pdf_outline.
+    An asyncio front end puts requests into a bounded queue and a fixed number of dispatchers hand them
+    to a process pool, so the fitz work never blocks the event loop and no interpreter is started per document.
+    When the queue is full, new requests are rejected with 503 right away instead of piling up.
+
+    Endpoints:
+      POST /extract  JSON body {"pdf": <path>, "start": s, "end": e, "bookmarks": true, "time_budget": t}
+                     or the PDF bytes themselves (any other content type) with ?start=&end=&bookmarks=1&time_budget=
+      GET  /metrics  queue depth, busy workers and request counters
+      GET  /health
+    Responses are JSON: {"ok": true, "result": {...}} or {"ok": false, "error": "..."}.
+    """
+
+    def __init__(self, workers=None, queue_size=SERVICE_QUEUE_SIZE, cache_dir=None, time_budget=None):
+        self.workers = workers or available_cpu_count()
+        self.queue_size = queue_size
+        self.cache_dir = cache_dir
+        self.time_budget = time_budget # Default for requests that don't set their own
+        self.executor = None
+        self.queue = None
+        self.dispatchers = []
+        self.counters = Counter()
+        self.max_queue_depth = 0
+        self.busy_workers = 0
+        self.task_seconds = 0.0
+
+    def start(self):
+        """Starts the process pool and the dispatchers. Must be called from the running event loop."""
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+
+    def close(self):
+        for dispatcher in self.dispatchers:
+            dispatcher.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def metrics(self):
+        return {
+            "workers": self.workers,
+            "busy_workers": self.busy_workers,
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue_size,
+            "max_queue_depth": self.max_queue_depth,
+            "requests": self.counters["requests"],
+            "completed": self.counters["completed"],
+            "failed": self.counters["failed"],
+            "rejected": self.counters["rejected"],
+            "task_seconds": round(self.task_seconds, 6),
+        }
+
+    async def extract(self, job):
+        """Queues one extraction job (the arguments of _service_extract_task) and waits for its result."""
+        if self.queue.full():
+            self.counters["rejected"] += 1
+            raise ServiceError(503, "extraction queue is full, retry later")
+
+        reply = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((job, reply))
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return await reply
+
+    async def _dispatch(self):
+        """Feeds queued jobs to the process pool, one at a time, so at most `workers` jobs leave the queue."""
+        loop = asyncio.get_running_loop()
+        while True:
+            job, reply = await self.queue.get()
+            executor = self.executor
+            self.busy_workers += 1
+            task_start = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(executor, _service_extract_task, *job)
+            except Exception as e:
+                if isinstance(e, concurrent.futures.process.BrokenProcessPool) and executor is self.executor:
+                    # A pool process died (e.g. inside MuPDF): replace the pool so that later requests still run
+                    print(f"⚠️ Process pool broke, restarting it: {e}", file=sys.stderr)
+                    executor.shutdown(wait=False)
+                    self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+                if not reply.done():
+                    reply.set_exception(e)
+            else:
+                if not reply.done():
+                    reply.set_result(result)
+            finally:
+                self.busy_workers -= 1
+                self.task_seconds += time.perf_counter() - task_start
+
+    async def handle_connection(self, reader, writer):
+        """Serves the HTTP/1.1 requests of one client connection."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+
+                headers = {}
+                while True:
+                    header_line = await reader.readline()
+                    if header_line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header_line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                status, response = await self.handle_request(method, target, headers, reader)
+
+                # Error responses may leave an unread body behind, so only successful requests keep the connection
+                keep_alive = status == 200 and version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                payload = json.dumps(response, ensure_ascii=False).encode("utf-8")
+                writer.write((
+                    f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                ).encode("latin-1") + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass # Malformed request or client gone: drop the connection
+        finally:
+            writer.close()
+
+    async def handle_request(self, method, target, headers, reader):
+        """Routes one request and returns (HTTP status, response dict)."""
+        url = urllib.parse.urlsplit(target)
+        try:
+            if url.path == "/health" and method == "GET":
+                return 200, {"ok": True}
+            if url.path == "/metrics" and method == "GET":
+                return 200, {"ok": True, "metrics": self.metrics()}
+            if url.path != "/extract":
+                raise ServiceError(404, f"unknown path {url.path}")
+            if method != "POST":
+                raise ServiceError(405, "use POST for /extract")
+            if self.queue.full():
+                # Rejected before the upload is read; the connection is closed with the body unread
+                self.counters["rejected"] += 1
+                raise ServiceError(503, "extraction queue is full, retry later")
+
+            job = self._parse_extract_request(headers, url.query, await self._read_body(headers, reader))
+            self.counters["requests"] += 1
+            try:
+                result = await self.extract(job)
+            except ServiceError:
+                raise
+            except Exception as e:
+                self.counters["failed"] += 1
+                return 500, {"ok": False, "error": str(e)}
+            self.counters["completed"] += 1
+            return 200, {"ok": True, "result": result}
+        except ServiceError as e:
+            return e.status, {"ok": False, "error": str(e)}
+
+    async def _read_body(self, headers, reader):
+        if "content-length" not in headers:
+            raise ServiceError(411, "Content-Length is required")
+        try:
+            length = int(headers["content-length"])
+        except ValueError:
+            raise ServiceError(400, "invalid Content-Length")
+        if length > SERVICE_MAX_UPLOAD_BYTES:
+            raise ServiceError(413, f"request body is larger than {SERVICE_MAX_UPLOAD_BYTES} bytes")
+        return await reader.readexactly(length)
+
+    def _parse_extract_request(self, headers, query, body):
+        """Turns an /extract request into the arguments of _service_extract_task."""
+        if headers.get("content-type", "").split(";")[0].strip() == "application/json":
+            # A PDF on the local filesystem, as in the worker protocol
+            try:
+                request = json.loads(body)
+            except ValueError:
+                raise ServiceError(400, "request body is not valid JSON")
+            if not isinstance(request, dict) or not request.get("pdf"):
+                raise ServiceError(400, "missing 'pdf' in request")
+            pdf = request["pdf"]
+        else:
+            # The PDF bytes themselves; options come from the query string
+            request = dict(urllib.parse.parse_qsl(query))
+            if not body:
+                raise ServiceError(400, "empty PDF upload")
+            pdf = body
+
+        try:
+            start_page = int(request.get("start") or 0)
+            end_page = None if request.get("end") in (None, "") else int(request["end"])
+        except (TypeError, ValueError):
+            raise ServiceError(400, "'start' and 'end' must be page numbers")
+        try:
+            time_budget = float(request["time_budget"]) if request.get("time_budget") else self.time_budget
+        except (TypeError, ValueError):
+            raise ServiceError(400, "'time_budget' must be a number of seconds")
+        use_bookmarks = request.get("bookmarks") in (True, "1", "true")
+
+        return pdf, start_page, end_page, use_bookmarks, time_budget, self.cache_dir
+
+
+async def _run_service(service, host, port, socket_path):
+    service.start()
+    if socket_path:
+        server = await asyncio.start_unix_server(service.handle_connection, path=socket_path)
+        address = socket_path
+    else:
+        server = await asyncio.start_server(service.handle_connection, host, port)
+        address = f"http://{host}:{port}"
+    print(f"✅ Outline service listening on {address} with {service.workers} workers", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def serve_service(host="127.0.0.1", port=SERVICE_PORT, socket_path=None, workers=None, queue_size=SERVICE_QUEUE_SIZE, cache_dir=None, time_budget=None):
+    """Runs an OutlineService on a TCP port or a Unix socket until interrupted."""
+    service = OutlineService(workers, queue_size, cache_dir, time_budget)
+    try:
+        asyncio.run(_run_service(service, host, port, socket_path))
+    except KeyboardInterrupt:
+        pass
+
+
+def pop_option(args, name, default=None):
+    """Removes "<name> <value>" from args and returns the value, or default if the option is absent."""
+    if name not in args:
+        return default
+    index = args.index(name)
+    if index + 1 >= len(args):
+        print(f"❌ Missing value for {name}")
+        sys.exit(1)
+    value = args[index + 1]
+    del args[index:index + 2]
+    return value
+
+
+def pop_flag(args, name):
+    """Removes a flag from args and returns whether it was present."""
+    if name not in args:
+        return False
+    args.remove(name)
+    return True
+
 
 def main():
     args = sys.argv[1:]
 
-    if "--count" in args:
+    # Options shared by every mode
+    cache_dir = pop_option(args, "--cache-dir", os.environ.get("OUTLINE_CACHE_DIR")) # Optional on-disk result cache
+    emit_metrics = pop_flag(args, "--metrics") # Per-stage timers and counters as JSON on stderr
+    cprofile_path = pop_option(args, "--cprofile") # Dump cProfile stats of the run to this path
+    use_bookmarks = pop_flag(args, "--bookmarks") # Use usable embedded bookmarks instead of layout analysis
+    time_budget = pop_option(args, "--time-budget") # Seconds per document before the extraction degrades
+    time_budget = float(time_budget) if time_budget else None
+    low_memory = pop_flag(args, "--low-memory") # Release pages and MuPDF caches as soon as each page is done
+    index_path = pop_option(args, "--index", os.environ.get("OUTLINE_INDEX")) # Also add written outlines to this heading index
+    style_profiles = pop_flag(args, "--style-profiles") # Reuse the statistics of documents of the same style (needs --cache-dir)
+    cache = open_cache(cache_dir)
+
+    if "--worker" in args:
+        serve_worker(cache=cache, emit_metrics=emit_metrics, index=open_index(index_path))
+        return
+
+    if "--query" in args:
+        text = pop_option(args, "--text")
+        level = pop_option(args, "--level")
+        pages = pop_option(args, "--pages") # "3" or "1-3"
+        document = pop_option(args, "--document")
+        limit = pop_option(args, "--limit", "100")
+        documents_only = pop_flag(args, "--documents")
+        if len(args) < 2 or not os.path.exists(args[1]):
+            print("❌ Missing or unknown index path for --query")
+            sys.exit(1)
+        if level is not None and f"H{level.upper().lstrip('H')}" not in HEADING_LEVELS:
+            print(f"❌ Invalid heading level for --level: {level} (use H1–H5 or 1–5)")
+            sys.exit(1)
+        first_page = last_page = None
+        if pages:
+            first_page, _, last_page = pages.partition("-")
+            try:
+                first_page, last_page = int(first_page), int(last_page or first_page)
+            except ValueError:
+                print(f"❌ Invalid page range for --pages: {pages} (use <first> or <first>-<last>)")
+                sys.exit(1)
+        try:
+            limit = int(limit)
+        except ValueError:
+            print(f"❌ Invalid number for --limit: {limit}")
+            sys.exit(1)
+        for match in open_index(args[1]).query(text, level, first_page, last_page, document, limit, documents_only):
+            print(json.dumps(match, ensure_ascii=False))
+        return
+
+    if "--build-index" in args:
+        if len(args) < 3:
+            print("❌ Missing output directory or index path for --build-index")
+            sys.exit(1)
+        indexed = index_output_dir(open_index(args[2]), args[1])
+        print(f"✅ Indexed {indexed} outline(s) from {args[1]} into {args[2]}")
+        return
+
+    if "--serve" in args:
+        host = pop_option(args, "--host", "127.0.0.1")
+        port = int(pop_option(args, "--port", SERVICE_PORT))
+        socket_path = pop_option(args, "--socket") # Listen on a Unix socket instead of a TCP port
+        workers = int(pop_option(args, "--workers", 0)) or None
+        queue_size = int(pop_option(args, "--queue-size", SERVICE_QUEUE_SIZE))
+        serve_service(host, port, socket_path, workers, queue_size, cache_dir, time_budget)
+        return
+
+    if "--batch" in args:
+        if len(args) < 3:
+            print("❌ Missing input or output directory for --batch")
+            sys.exit(1)
+        run_batch(args[1], args[2], cache_dir=cache_dir, emit_metrics=emit_metrics, use_bookmarks=use_bookmarks, time_budget=time_budget,
+                  low_memory=low_memory, index_path=index_path, style_profiles=style_profiles)
+        return
+
+    if not (emit_metrics or cprofile_path):
+        run_command(args, cache, use_bookmarks, time_budget, low_memory, open_index(index_path), style_profiles)
+        return
+
+    with collect_metrics(cprofile_path) as metrics:
+        try:
+            run_command(args, cache, use_bookmarks, time_budget, low_memory, open_index(index_path), style_profiles)
+        finally:
+            print(json.dumps({"args": args, "metrics": metrics.to_dict()}, ensure_ascii=False), file=sys.stderr)
+
+
+def run_command(args, cache, use_bookmarks=False, time_budget=None, low_memory=False, index=None, style_profiles=False):
+    """Runs one of the single-document modes of the command line. Whole-document outlines are also added to the index if one is given."""
+    if "--stream" in args:
+        if len(args) < 2:
+            print("❌ Missing PDF path for --stream")
+            sys.exit(1)
+        pdf_path = args[1]
+        output_file = args[2] if len(args) > 2 else os.path.splitext(pdf_path)[0] + ".jsonl"
+        os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+        with open(output_file, "w", encoding="utf-8") as f:
+            write_outline_jsonl(iter_pdf_outline(pdf_path, cache=cache, use_bookmarks=use_bookmarks, low_memory=low_memory, style_profiles=style_profiles), f)
+        print(f"✅ Output streamed to {output_file}")
+        return
+
+    if "--profile" in args:
+        if len(args) < 3:
+            print("❌ Missing PDF path or output path for --profile")
+            sys.exit(1)
+        pdf_path = args[1]
+        output_file = args[2]
+        try:
+            result = build_document_profile(pdf_path, cache=cache, style_profiles=style_profiles)
+        except Exception as e:
+            print(f"❌ Failed to profile {pdf_path}: {e}")
+            sys.exit(1)
+
+    elif "--count" in args:
         if len(args) < 2:
             print("❌ Missing PDF path for --count")
             sys.exit(1)
         pdf_path = args[1]
         try:
-            doc = fitz.open(pdf_path)
-            print(len(doc))
+            print(count_pages(pdf_path))
         except Exception as e:
             print(f"❌ Failed to open PDF: {e}")
             sys.exit(1)
         return
 
-    if len(args) == 1:
+    elif len(args) == 1:
         pdf_path = args[0]
-        result = extract_pdf_outline(pdf_path)
+        result = extract_pdf_outline(pdf_path, cache=cache, use_bookmarks=use_bookmarks, time_budget=time_budget, low_memory=low_memory,
+                                     style_profiles=style_profiles)
         output_file = os.path.splitext(pdf_path)[0] + ".json"
 
-    elif len(args) == 4:
+    elif len(args) in (4, 5):
         pdf_path = args[0]
         start_page = int(args[1])
         end_page = int(args[2])
         output_file = args[3]
 
-        # Generate a unique temp file name for safe parallel execution
-        temp_pdf_path = f"_temp_extract_slice_{uuid.uuid4().hex}.pdf"
-
         try:
-            doc = fitz.open(pdf_path)
-            doc.select(range(start_page, end_page))
-            doc.save(temp_pdf_path)
-            doc.close()
-
-            result = extract_pdf_outline(temp_pdf_path)
+            profile = load_document_profile(args[4]) if len(args) == 5 else None
+            result = extract_pdf_outline(pdf_path, start_page, end_page, profile, cache, use_bookmarks, time_budget, low_memory, style_profiles)
         except Exception as e:
             print(f"❌ Failed to extract from {pdf_path} (pages {start_page}-{end_page}): {e}")
             sys.exit(1)
-        finally:
-            try:
-                os.remove(temp_pdf_path)
-            except FileNotFoundError:
-                print(f"⚠️ Temp file {temp_pdf_path} not found for cleanup.")
 
     else:
         print("❌ Usage:\n"
               "  python3 extract.py <pdf_path>\n"
-              "  python3 extract.py <pdf_path> <start_page> <end_page> <output_path>\n"
-              "  python3 extract.py --count <pdf_path>")
+              "  python3 extract.py <pdf_path> <start_page> <end_page> <output_path> [<profile_path>]\n"
+              "  python3 extract.py --profile <pdf_path> <output_path>\n"
+              "  python3 extract.py --count <pdf_path>\n"
+              "  python3 extract.py --batch <input_dir> <output_dir>\n"
+              "  python3 extract.py --stream <pdf_path> [<output_path>]\n"
+              "  python3 extract.py --worker\n"
+              "  python3 extract.py --serve [--host <host>] [--port <port> | --socket <path>] [--workers <n>] [--queue-size <n>]\n"
+              "  python3 extract.py --build-index <output_dir> <index_path>\n"
+              "  python3 extract.py --query <index_path> [--text <words>] [--level <H1-H4>] [--pages <first>[-<last>]] [--document <name>]\n"
+              "                     [--documents] [--limit <n>]\n"
+              "Any mode accepts --cache-dir <dir> (or OUTLINE_CACHE_DIR) to reuse results of unchanged PDFs and pages,\n"
+              "--metrics to print per-stage timers and counters as JSON on stderr, --cprofile <path> to dump cProfile stats,\n"
+              "--bookmarks to use the PDF's embedded bookmarks as the outline when they look usable,\n"
+              "--time-budget <seconds> to degrade (sampled statistics, pattern-only, partial outline) instead of running over time,\n"
+              "--low-memory to keep memory flat on very large PDFs,\n"
+              "--style-profiles to reuse the statistics of PDFs made from the same template (with --cache-dir)\n"
+              "and --index <path> (or OUTLINE_INDEX) to add every whole-document outline to a searchable heading index.")
         sys.exit(1)
 
-    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
-
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(result, f, indent=4, ensure_ascii=False)
+    write_outline_json(result, output_file)
+    if index is not None and len(args) == 1:
+        index.add(os.path.basename(pdf_path), result)
 
     print(f"✅ Output saved to {output_file}")
 
@@ -0,0 +1,251 @@
+import asyncio
+import json
+import random
+import sys
+
+import fitz
+import pytest
+
+import extract
+
+
+def form_xobject_pdf(text):
+    """Returns a one-page PDF whose page only draws a form XObject holding the given text."""
+    source = fitz.open()
+    source.new_page().insert_text((72, 72), text, fontsize=14)
+    doc = fitz.open()
+    doc.new_page().show_pdf_page(fitz.Rect(0, 0, 595, 842), source, 0)
+    return fitz.open("pdf", doc.tobytes())
+
+
+def page_texts(blocks):
+    return [line["text"] for block in blocks for line in block["lines"]]
+
+
+def test_page_cache_tells_apart_same_named_form_xobjects(tmp_path):
+    first = form_xobject_pdf("Alpha document heading")
+    second = form_xobject_pdf("Bravo document heading")
+    # Both pages have the same content stream and the same resource names
+    assert first[0].read_contents() == second[0].read_contents()
+    assert extract.page_content_hash(first[0]) != extract.page_content_hash(second[0])
+
+    cache = extract.OutlineCache(str(tmp_path))
+    extract.extract_pages_layout(first, [0], False, cache)
+    layout = extract.extract_pages_layout(second, [0], False, cache)
+    assert page_texts(layout[0]) == ["Bravo document heading"]
+
+
+def test_page_cache_keys_survive_appended_pages(tmp_path):
+    doc = fitz.open()
+    for page_num in range(3):
+        doc.new_page().insert_text((72, 72), f"Page {page_num + 1} heading", fontsize=14)
+    doc.save(tmp_path / "original.pdf")
+    hashes = [extract.page_content_hash(page) for page in doc]
+
+    doc.new_page().insert_text((72, 72), "Appended heading", fontsize=14)
+    doc.save(tmp_path / "appended.pdf", garbage=4)
+    with fitz.open(tmp_path / "appended.pdf") as appended:
+        assert [extract.page_content_hash(page) for page in appended][:3] == hashes
+
+
+def test_classify_headings_matches_get_heading_level():
+    rng = random.Random(6)
+    texts = ["1 Introduction", "2.3 Scope of Work", "(a) First item", "Appendix B: Tables", "REVISION HISTORY",
+             "Summary", "The quick brown fox jumps over the lazy dog.", "  12  ", "Conclusion", "第1章 概要", ""]
+    for body_text_font_size, min_x0_doc in [(10.0, 72.0), (11.5, None), (None, 50.0)]:
+        lines = [(rng.choice(texts), rng.choice([9.0, 10.0, 11.5, 12.0, 13.0, 14.5, 16.0, 18.0, 24.0]) + rng.random() / 10,
+                  rng.random() < 0.3, rng.choice([None, 0, 2.0, 8.0, 14.0, 30.0]), rng.choice([None, 50.0, 72.0, 73.5, 90.0]))
+                 for _ in range(5000)]
+        expected = [get_heading_level_args(line, body_text_font_size, min_x0_doc) for line in lines]
+        actual = extract.classify_headings(*[list(column) for column in zip(*lines)], body_text_font_size, min_x0_doc)
+        assert actual == expected
+
+
+def get_heading_level_args(line, body_text_font_size, min_x0_doc):
+    text, font_size, is_bold, space_above, x0_position = line
+    return extract.get_heading_level(text, font_size, is_bold, body_text_font_size, space_above, x0_position, min_x0_doc)
+
+
+def bookmarked_pdf(path, pages):
+    doc = fitz.open()
+    for page_num in range(pages):
+        doc.new_page().insert_text((72, 72), f"Section {page_num + 1}", fontsize=14)
+    doc.set_toc([[1, f"Section {page_num + 1}", page_num + 1] for page_num in range(0, pages, 5)])
+    doc.save(path)
+
+
+def test_profile_request_returns_usable_bookmarks(tmp_path):
+    bookmarked_pdf(tmp_path / "book.pdf", 30)
+    pdf_path = str(tmp_path / "book.pdf")
+    response = extract.handle_worker_request({"op": "profile", "pdf": pdf_path, "bookmarks": True})
+    assert response == {"ok": True, "pages": 30, "result": extract.extract_pdf_outline(pdf_path, use_bookmarks=True)}
+    assert "profile" in extract.handle_worker_request({"op": "profile", "pdf": pdf_path})
+
+
+def test_run_batch_does_not_split_pdfs_with_usable_bookmarks(tmp_path):
+    bookmarked_pdf(tmp_path / "book.pdf", 30)
+    timings = extract.run_batch(str(tmp_path), str(tmp_path / "out"), workers=2, chunk_pages=10, use_bookmarks=True)
+    assert timings["book.pdf"]["tasks"] == 1
+    with open(tmp_path / "out" / "book.json", encoding="utf-8") as f:
+        assert json.load(f) == extract.extract_pdf_outline(str(tmp_path / "book.pdf"), use_bookmarks=True)
+
+
+async def service_request(port, head, body=b""):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
+    headers = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+    length = int(headers.split("Content-Length: ")[1].split("\r\n")[0])
+    payload = await reader.readexactly(length)
+    writer.close()
+    return headers, json.loads(payload)
+
+
+def run_service(test, queue_size=4):
+    async def main():
+        service = extract.OutlineService(workers=1, queue_size=queue_size)
+        service.start()
+        server = await asyncio.start_server(service.handle_connection, "127.0.0.1", 0)
+        try:
+            return await test(service, server.sockets[0].getsockname()[1])
+        finally:
+            server.close()
+            service.close()
+    return asyncio.run(main())
+
+
+def test_service_extracts_uploaded_pdfs():
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "1 Introduction", fontsize=14)
+    pdf_bytes = doc.tobytes()
+
+    async def test(service, port):
+        headers, response = await service_request(port, f"POST /extract HTTP/1.1\r\nContent-Length: {len(pdf_bytes)}\r\nConnection: close\r\n\r\n", pdf_bytes)
+        assert headers.startswith("HTTP/1.1 200") and response == {"ok": True, "result": extract.extract_pdf_outline(pdf_bytes)}
+        headers, response = await service_request(port, "POST /extract HTTP/1.1\r\nContent-Length: 9\r\n\r\n", b"not a pdf")
+        assert headers.startswith("HTTP/1.1 400") and not response["ok"]
+        headers, response = await service_request(port, "POST /extract HTTP/1.1\r\nContent-Type: application/json\r\nContent-Length: 2\r\n\r\n", b"{}")
+        assert headers.startswith("HTTP/1.1 400") and response["error"] == "missing 'pdf' in request"
+        assert service.metrics()["completed"] == 1
+    run_service(test)
+
+
+def test_service_rejects_requests_before_reading_the_body_when_the_queue_is_full():
+    async def test(service, port):
+        for dispatcher in service.dispatchers:
+            dispatcher.cancel()
+        service.queue.put_nowait(None)
+        # The announced body is never sent, so reading it would hang
+        headers, response = await asyncio.wait_for(
+            service_request(port, "POST /extract HTTP/1.1\r\nContent-Length: 100000000\r\n\r\n"), timeout=5)
+        assert headers.startswith("HTTP/1.1 503") and "Connection: close" in headers
+        assert service.metrics()["rejected"] == 1
+    run_service(test, queue_size=1)
+
+
+def outline(*headings):
+    return {"title": "Doc", "outline": [{"level": level, "text": text, "page": page} for level, text, page in headings]}
+
+
+def test_heading_index_replaces_documents_and_filters_queries(tmp_path):
+    index = extract.HeadingIndex(str(tmp_path / "index.db"))
+    index.add("a.pdf", outline(("H1", "Project Budget", 1), ("H2", "Budget Details", 4)))
+    index.add("b.pdf", outline(("H1", "Introduction", 1), ("H3", "Annual Budget", 9)))
+    assert [match["document"] for match in index.query("budget")] == ["a.pdf", "a.pdf", "b.pdf"]
+
+    # Replacing a document must also drop its old rows from the full-text index
+    index.add("a.pdf", outline(("H1", "Overview", 2)))
+    assert [(match["document"], match["text"]) for match in index.query("budget")] == [("b.pdf", "Annual Budget")]
+    assert index.query("details") == []
+    assert index._conn.execute("SELECT rowid FROM headings_fts WHERE headings_fts MATCH 'budget OR details'").fetchall() == [(4,)]
+    assert [match["text"] for match in index.query("overview")] == ["Overview"]
+
+    assert [match["text"] for match in index.query(level="H1")] == ["Overview", "Introduction"]
+    assert [match["text"] for match in index.query(level=3)] == ["Annual Budget"]
+    assert [match["text"] for match in index.query(first_page=2, last_page=9)] == ["Overview", "Annual Budget"]
+    assert [match["text"] for match in index.query(document="b.pdf", limit=1)] == ["Introduction"]
+    assert index.query(documents_only=True) == [{"document": "a.pdf", "title": "Doc", "matches": 1},
+                                                {"document": "b.pdf", "title": "Doc", "matches": 2}]
+
+
+def test_query_rejects_invalid_levels(tmp_path, monkeypatch, capsys):
+    extract.HeadingIndex(str(tmp_path / "index.db"))
+    monkeypatch.setattr(sys, "argv", ["extract.py", "--query", str(tmp_path / "index.db"), "--level", "X"])
+    with pytest.raises(SystemExit):
+        extract.main()
+    assert "Invalid heading level" in capsys.readouterr().out
+
+
+def test_run_batch_merges_page_ranges(tmp_path):
+    doc = fitz.open()
+    for page_num in range(30):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"{page_num + 1} Chapter {page_num + 1}", fontsize=16)
+        page.insert_text((72, 100), "Body text of the chapter.", fontsize=10)
+    doc.save(tmp_path / "long.pdf")
+
+    timings = extract.run_batch(str(tmp_path), str(tmp_path / "out"), workers=2, chunk_pages=10)
+    assert timings["long.pdf"]["tasks"] == 4 # One profile and three ranges
+    with open(tmp_path / "out" / "long.json", encoding="utf-8") as f:
+        assert json.load(f) == extract.extract_pdf_outline(str(tmp_path / "long.pdf"))
+
+
+def test_chunked_extraction_excludes_the_same_footers_as_a_single_pass(tmp_path):
+    page_count = 300
+    detected_pages = extract.header_footer_pages(page_count)
+    # Footer pages chosen so that the footer is on exactly half of the pages a single pass looks at,
+    # but on fewer than half of a second sample taken from those pages
+    resampled_pages = {detected_pages[offset] for offset in extract.header_footer_pages(len(detected_pages))}
+    later_pages = [page_num for page_num in detected_pages if page_num >= extract.HEADER_FOOTER_PAGES]
+    footer_pages = set(sorted(later_pages, key=lambda page_num: page_num in resampled_pages)[:len(detected_pages) // 2])
+
+    doc = fitz.open()
+    for page_num in range(page_count):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"{page_num + 1} Chapter {page_num + 1}", fontsize=16)
+        page.insert_text((72, 100), "Body text of the chapter.", fontsize=10)
+        if page_num in footer_pages:
+            page.insert_text((72, 800), "Appendix: Internal Review Copy", fontsize=8)
+    pdf_path = str(tmp_path / "long.pdf")
+    doc.save(pdf_path)
+
+    single_pass = extract.extract_pdf_outline(pdf_path)
+    assert "Internal Review Copy" not in [heading["text"] for heading in single_pass["outline"]]
+
+    profile = extract.build_document_profile(pdf_path)
+    ranges = [extract.extract_pdf_outline(pdf_path, start_page, start_page + 100, profile) for start_page in range(0, page_count, 100)]
+    assert extract.merge_range_outlines(ranges) == single_pass
+    streamed = list(extract.iter_pdf_outline(pdf_path))
+    assert streamed[0] == {"title": single_pass["title"]} and streamed[1:] == single_pass["outline"]
+
+
+def template_pdf(path, section_name):
+    doc = fitz.open()
+    doc.set_metadata({"producer": "Report Generator 2.1", "creator": "Reports"})
+    for page_num in range(60):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"{page_num + 1} {section_name} {page_num + 1}", fontsize=16)
+        page.insert_text((72, 100), "Body text of the report.", fontsize=10)
+    doc.save(path)
+    return str(path)
+
+
+def test_style_profiles_are_recorded_by_whole_document_runs_and_used_by_profiles(tmp_path):
+    cache = extract.OutlineCache(str(tmp_path / "cache"))
+    for section_name in ("Finding", "Result"):
+        with extract.collect_metrics() as metrics:
+            extract.extract_pdf_outline(template_pdf(tmp_path / f"{section_name}.pdf", section_name), cache=cache, style_profiles=True)
+        assert metrics.counters["style_profile_hits"] == 0
+
+    pdf_path = template_pdf(tmp_path / "report.pdf", "Measure")
+    with extract.collect_metrics() as metrics:
+        profile = extract.build_document_profile(pdf_path, cache=cache, style_profiles=True)
+    assert metrics.counters["style_profile_hits"] == 1
+    assert profile["sampled_pages"] == extract.HEADER_FOOTER_PAGES
+    assert extract.extract_pdf_outline(pdf_path, profile=profile) == extract.extract_pdf_outline(pdf_path)
+
+    # The in-memory path computes its own statistics even when its style matches
+    with extract.collect_metrics() as metrics:
+        result = extract.extract_pdf_outline(pdf_path, cache=cache, style_profiles=True)
+    assert metrics.counters["style_profile_hits"] == 0
+    assert result == extract.extract_pdf_outline(pdf_path)
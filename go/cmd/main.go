@@ -29,18 +29,27 @@ func main() {
 		log.Fatalf("❌ Failed to read input dir: %v", err)
 	}
 
+	// Long-lived Python workers shared by all PDFs
+	pool, err := processor.NewWorkerPool(processor.PoolSize)
+	if err != nil {
+		log.Fatalf("❌ Failed to start Python workers: %v", err)
+	}
+	defer pool.Close()
+
+	var pdfs []string
 	for _, file := range files {
 		if strings.HasSuffix(file.Name(), ".pdf") {
-			fmt.Printf("📄 Processing: %s\n", file.Name())
-			processStart := time.Now()
-
-			// Process PDF
-			processor.ProcessPDF(file.Name())
-
-			fmt.Printf("⏱️ Finished %s in %v\n\n", file.Name(), time.Since(processStart))
+			pdfs = append(pdfs, file.Name())
 		}
 	}
 
+	// All PDFs share one queue of page ranges, largest first
+	processor.NewScheduler(pool).ProcessAll(pdfs)
+
 	fmt.Printf("✅ All PDFs processed in %v.\n", time.Since(start))
+
+	if processor.MetricsEnabled {
+		processor.Metrics.WriteJSON(os.Stderr)
+	}
 }
 
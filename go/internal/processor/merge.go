@@ -1,46 +1,262 @@
 package processor
 
 import (
+	"bufio"
 	"encoding/json"
-	"log"
 	"os"
 	"sort"
+	"strings"
+	"sync"
 )
 
-// GlobalTitle is used to store the title from the first chunk
-var GlobalTitle string
+// mergeSource is the heading stream of one page range. Its headings arrive
+// in the extractor's order (page, then level, then position on the page).
+type mergeSource struct {
+	start   int       // first page of the range, 0-based
+	low     int       // no heading of this source can be on an earlier page
+	pending []Heading // received but not merged yet
+	title   string
+	done    bool
+	output  *FinalOutput
+	err     error // why the range failed, if it did
+}
+
+// FailedRange is a page range whose extraction failed, listed in the merged
+// output. Headings it streamed before failing are kept.
+type FailedRange struct {
+	FirstPage int    `json:"first_page"` // 1-based, inclusive
+	LastPage  int    `json:"last_page"`
+	Error     string `json:"error"`
+}
 
-func MergeHeadings(files []string) []Heading {
-	all := []Heading{}
-	titleExtracted := false
+// OutlineMerger does a k-way merge of the heading streams of the page
+// ranges of one PDF. Headings are written to the output file as soon as no
+// unfinished range can still produce an earlier one, and a heading whose
+// text already appeared is dropped, like a single pass over the document.
+type OutlineMerger struct {
+	mu       sync.Mutex
+	filename string
+	pages    int
+	sources  []*mergeSource // in page order
+	seen     map[string]struct{}
 
-	for _, f := range files {
-		data, err := os.ReadFile(f)
-		if err != nil {
-			log.Printf("⚠️ Skipping %s: %v", f, err)
-			continue
+	file    *os.File
+	out     *bufio.Writer
+	written int // headings written so far
+}
+
+// NewOutlineMerger creates the merger for outputDir/<name>.json of a PDF
+// with the given number of pages
+func NewOutlineMerger(filename string, pages int) *OutlineMerger {
+	return &OutlineMerger{filename: filename, pages: pages, seen: map[string]struct{}{}}
+}
+
+// AddSource registers the page range starting at start. Every range must be
+// registered before any heading of a later range can be written.
+func (m *OutlineMerger) AddSource(start int) {
+	m.mu.Lock()
+	defer m.mu.Unlock()
+
+	i := sort.Search(len(m.sources), func(i int) bool { return m.sources[i].start >= start })
+	src := &mergeSource{start: start, low: start + 1}
+	m.sources = append(m.sources, nil)
+	copy(m.sources[i+1:], m.sources[i:])
+	m.sources[i] = src
+}
+
+func (m *OutlineMerger) source(start int) *mergeSource {
+	i := sort.Search(len(m.sources), func(i int) bool { return m.sources[i].start >= start })
+	return m.sources[i]
+}
+
+// SetTitle records the title reported by the range starting at start
+func (m *OutlineMerger) SetTitle(start int, title string) {
+	m.mu.Lock()
+	defer m.mu.Unlock()
+	m.source(start).title = title
+}
+
+// Add queues one heading of the range starting at start and writes whatever
+// can be merged
+func (m *OutlineMerger) Add(start int, h Heading) {
+	m.mu.Lock()
+	defer m.mu.Unlock()
+
+	src := m.source(start)
+	src.pending = append(src.pending, h)
+	if h.Page > src.low {
+		src.low = h.Page
+	}
+	m.flush()
+}
+
+// Done marks the range starting at start as finished; output is what its
+// request returned
+func (m *OutlineMerger) Done(start int, output *FinalOutput) {
+	m.mu.Lock()
+	defer m.mu.Unlock()
+
+	src := m.source(start)
+	src.done = true
+	src.output = output
+	if output.Title != "" {
+		src.title = output.Title
+	}
+	m.flush()
+}
+
+// Fail marks the range starting at start as finished with an error. The
+// output lists it under "failed_ranges".
+func (m *OutlineMerger) Fail(start int, err error) {
+	m.mu.Lock()
+	defer m.mu.Unlock()
+
+	src := m.source(start)
+	src.done = true
+	src.err = err
+	m.flush()
+}
+
+// precedes orders headings by page, then by the range they come from
+func precedes(pageA int, a *mergeSource, pageB int, b *mergeSource) bool {
+	return pageA < pageB || pageA == pageB && a.start < b.start
+}
+
+// flush writes the merged headings that no unfinished range can precede
+func (m *OutlineMerger) flush() {
+	for {
+		var best *mergeSource
+		for _, src := range m.sources {
+			if len(src.pending) > 0 && (best == nil || precedes(src.pending[0].Page, src, best.pending[0].Page, best)) {
+				best = src
+			}
 		}
-		var part struct {
-			Title   string    `json:"title"`
-			Outline []Heading `json:"outline"`
+		if best == nil {
+			return
 		}
-		if err := json.Unmarshal(data, &part); err != nil {
-			log.Printf("⚠️ Invalid JSON in %s: %v", f, err)
+
+		h := best.pending[0]
+		for _, src := range m.sources {
+			if src != best && len(src.pending) == 0 && !src.done && precedes(src.low, src, h.Page, best) {
+				return
+			}
+		}
+		best.pending = best.pending[1:]
+
+		if _, dup := m.seen[h.Text]; dup {
 			continue
 		}
+		m.seen[h.Text] = struct{}{}
+		m.write(h)
+	}
+}
 
-		if !titleExtracted && part.Title != "" {
-			GlobalTitle = part.Title
-			titleExtracted = true
+// open creates the output file and writes everything up to the outline.
+// The title is the one of the first range that has one, falling back to the file name.
+func (m *OutlineMerger) open() {
+	if m.out != nil {
+		return
+	}
+	title := ""
+	for _, src := range m.sources {
+		if src.title != "" {
+			title = src.title
+			break
 		}
+	}
+	if title == "" {
+		title = strings.TrimSuffix(m.filename, ".pdf")
+	}
+
+	file, _ := os.Create(outputPath(m.filename))
+	m.file = file
+	m.out = bufio.NewWriter(file)
+	encodedTitle, _ := json.Marshal(title)
+	m.out.WriteString("{\n  \"title\": ")
+	m.out.Write(encodedTitle)
+	m.out.WriteString(",\n  \"outline\": [")
+}
 
-		all = append(all, part.Outline...)
+// write appends one heading in the layout of json.Encoder with a two-space indent
+func (m *OutlineMerger) write(h Heading) {
+	m.open()
+	if m.written > 0 {
+		m.out.WriteString(",")
 	}
+	encoded, _ := json.MarshalIndent(h, "    ", "  ")
+	m.out.WriteString("\n    ")
+	m.out.Write(encoded)
+	m.written++
+	m.out.Flush()
+}
 
-	sort.Slice(all, func(i, j int) bool {
-		return all[i].Page < all[j].Page
-	})
+// writeField appends a top-level field after the outline
+func (m *OutlineMerger) writeField(name string, value interface{}) {
+	encoded, _ := json.MarshalIndent(value, "  ", "  ")
+	m.out.WriteString(",\n  \"" + name + "\": ")
+	m.out.Write(encoded)
+}
 
-	return all
+func containsString(values []string, value string) bool {
+	for _, v := range values {
+		if v == value {
+			return true
+		}
+	}
+	return false
 }
 
+// Close writes the rest of the output once every range is done. It reports
+// whether anything was written.
+func (m *OutlineMerger) Close() bool {
+	m.mu.Lock()
+	defer m.mu.Unlock()
+
+	truncated := false
+	succeeded := false
+	var degraded []string
+	var failed []FailedRange
+	for i, src := range m.sources {
+		if src.err != nil {
+			end := m.pages
+			if i+1 < len(m.sources) {
+				end = m.sources[i+1].start
+			}
+			failed = append(failed, FailedRange{FirstPage: src.start + 1, LastPage: end, Error: src.err.Error()})
+		}
+		if src.output == nil {
+			continue
+		}
+		succeeded = true
+		truncated = truncated || src.output.Truncated
+		// Ranges degrade independently; report every step any of them took
+		for _, step := range src.output.Degraded {
+			if !containsString(degraded, step) {
+				degraded = append(degraded, step)
+			}
+		}
+	}
+	if !succeeded && m.out == nil {
+		return false
+	}
+
+	m.open()
+	if m.written > 0 {
+		m.out.WriteString("\n  ]")
+	} else {
+		m.out.WriteString("]")
+	}
+	if len(degraded) > 0 {
+		m.writeField("degraded", degraded)
+	}
+	if truncated {
+		m.out.WriteString(",\n  \"truncated\": true")
+	}
+	if len(failed) > 0 {
+		m.writeField("failed_ranges", failed)
+	}
+	m.out.WriteString("\n}\n")
+	m.out.Flush()
+	m.file.Close()
+	return true
+}
@@ -0,0 +1,168 @@
+package processor
+
+import (
+	"encoding/json"
+	"errors"
+	"os"
+	"testing"
+)
+
+// mergeEvent is one call on an OutlineMerger, or a check of how many
+// headings it has written so far
+type mergeEvent struct {
+	op       string // "source", "title", "add", "done", "fail" or "written"
+	start    int    // range the event belongs to
+	page     int    // page of the heading ("add") or expected count ("written")
+	text     string // heading text ("add"), title ("title") or error ("fail")
+	degraded []string
+}
+
+// mergedOutput is the layout the merger must produce, in field order
+type mergedOutput struct {
+	Title        string        `json:"title"`
+	Outline      []Heading     `json:"outline"`
+	Degraded     []string      `json:"degraded,omitempty"`
+	Truncated    bool          `json:"truncated,omitempty"`
+	FailedRanges []FailedRange `json:"failed_ranges,omitempty"`
+}
+
+func heading(page int, text string) Heading {
+	return Heading{Level: "H1", Text: text, Page: page}
+}
+
+func TestOutlineMerger(t *testing.T) {
+	tests := []struct {
+		name   string
+		pages  int
+		events []mergeEvent
+		want   mergedOutput
+	}{
+		{
+			name:  "out-of-order arrival",
+			pages: 60,
+			events: []mergeEvent{
+				{op: "source", start: 0}, {op: "source", start: 20}, {op: "source", start: 40},
+				{op: "title", start: 0, text: "Doc"},
+				{op: "add", start: 20, page: 21, text: "B"},
+				{op: "add", start: 40, page: 41, text: "C"},
+				{op: "written", page: 0},
+				{op: "add", start: 0, page: 2, text: "A"},
+				{op: "written", page: 1}, // range 0 may still produce pages before 21
+				{op: "done", start: 0},
+				{op: "written", page: 2}, // range 20 may still produce pages before 41
+				{op: "done", start: 20},
+				{op: "done", start: 40},
+				{op: "written", page: 3},
+			},
+			want: mergedOutput{Title: "Doc", Outline: []Heading{heading(2, "A"), heading(21, "B"), heading(41, "C")}},
+		},
+		{
+			name:  "split range",
+			pages: 80,
+			events: []mergeEvent{
+				{op: "source", start: 0}, {op: "source", start: 40},
+				{op: "add", start: 40, page: 45, text: "C"},
+				{op: "source", start: 20}, // second half of range 0 handed to another worker
+				{op: "title", start: 0, text: "Doc"},
+				{op: "add", start: 0, page: 5, text: "A"},
+				{op: "done", start: 0},
+				{op: "written", page: 1},
+				{op: "add", start: 20, page: 30, text: "B"},
+				{op: "written", page: 2},
+				{op: "done", start: 20},
+				{op: "written", page: 3},
+				{op: "done", start: 40},
+			},
+			want: mergedOutput{Title: "Doc", Outline: []Heading{heading(5, "A"), heading(30, "B"), heading(45, "C")}},
+		},
+		{
+			name:  "cross-range dedup",
+			pages: 40,
+			events: []mergeEvent{
+				{op: "source", start: 0}, {op: "source", start: 20},
+				{op: "add", start: 20, page: 25, text: "Introduction"},
+				{op: "add", start: 20, page: 26, text: "Scope"},
+				{op: "done", start: 20},
+				{op: "add", start: 0, page: 3, text: "Introduction"},
+				{op: "done", start: 0},
+			},
+			want: mergedOutput{Title: "file", Outline: []Heading{heading(3, "Introduction"), heading(26, "Scope")}},
+		},
+		{
+			name:  "failed source",
+			pages: 40,
+			events: []mergeEvent{
+				{op: "source", start: 0}, {op: "source", start: 20},
+				{op: "add", start: 20, page: 21, text: "B"},
+				{op: "fail", start: 20, text: "worker died"},
+				{op: "add", start: 0, page: 2, text: "A"},
+				{op: "done", start: 0},
+			},
+			want: mergedOutput{
+				Title:        "file",
+				Outline:      []Heading{heading(2, "A"), heading(21, "B")},
+				FailedRanges: []FailedRange{{FirstPage: 21, LastPage: 40, Error: "worker died"}},
+			},
+		},
+		{
+			name:  "degraded ranges",
+			pages: 40,
+			events: []mergeEvent{
+				{op: "source", start: 0}, {op: "source", start: 20},
+				{op: "done", start: 20, degraded: []string{"sampled_statistics", "truncated"}},
+				{op: "done", start: 0, degraded: []string{"sampled_statistics"}},
+			},
+			want: mergedOutput{Title: "file", Outline: []Heading{}, Degraded: []string{"sampled_statistics", "truncated"}, Truncated: true},
+		},
+	}
+
+	for _, tt := range tests {
+		t.Run(tt.name, func(t *testing.T) {
+			outputDir = t.TempDir()
+			m := NewOutlineMerger("file.pdf", tt.pages)
+			for _, e := range tt.events {
+				switch e.op {
+				case "source":
+					m.AddSource(e.start)
+				case "title":
+					m.SetTitle(e.start, e.text)
+				case "add":
+					m.Add(e.start, heading(e.page, e.text))
+				case "done":
+					m.Done(e.start, &FinalOutput{Degraded: e.degraded, Truncated: containsString(e.degraded, "truncated")})
+				case "fail":
+					m.Fail(e.start, errors.New(e.text))
+				case "written":
+					if m.written != e.page {
+						t.Fatalf("written = %d, want %d", m.written, e.page)
+					}
+				}
+			}
+			if !m.Close() {
+				t.Fatal("Close() = false, want true")
+			}
+
+			got, err := os.ReadFile(outputPath("file.pdf"))
+			if err != nil {
+				t.Fatal(err)
+			}
+			want, _ := json.MarshalIndent(tt.want, "", "  ")
+			if string(got) != string(want)+"\n" {
+				t.Errorf("output:\n%s\nwant:\n%s", got, want)
+			}
+		})
+	}
+}
+
+func TestOutlineMergerAllFailed(t *testing.T) {
+	outputDir = t.TempDir()
+	m := NewOutlineMerger("file.pdf", 10)
+	m.AddSource(0)
+	m.Fail(0, errors.New("cannot open"))
+	if m.Close() {
+		t.Error("Close() = true for a PDF with no output, want false")
+	}
+	if _, err := os.Stat(outputPath("file.pdf")); !os.IsNotExist(err) {
+		t.Errorf("output file exists: %v", err)
+	}
+}
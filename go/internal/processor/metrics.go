@@ -0,0 +1,70 @@
+package processor
+
+import (
+	"encoding/json"
+	"os"
+	"sync"
+)
+
+// MetricsEnabled asks the Python workers for per-stage timers and counters
+// (set OUTLINE_METRICS=1)
+var MetricsEnabled = os.Getenv("OUTLINE_METRICS") == "1"
+
+// ExtractionMetrics mirrors ExtractionMetrics.to_dict() in extract.py
+type ExtractionMetrics struct {
+	StageSeconds map[string]float64 `json:"stage_seconds"`
+	Counters     map[string]int     `json:"counters"`
+}
+
+// MetricsAggregator sums the metrics of all chunks of all files
+type MetricsAggregator struct {
+	mu    sync.Mutex
+	total ExtractionMetrics
+	files map[string]*ExtractionMetrics
+}
+
+// Metrics collects the metrics of the whole run
+var Metrics = &MetricsAggregator{
+	total: ExtractionMetrics{StageSeconds: map[string]float64{}, Counters: map[string]int{}},
+	files: map[string]*ExtractionMetrics{},
+}
+
+// Add merges the metrics returned by one worker request for the given file
+func (a *MetricsAggregator) Add(filename string, raw json.RawMessage) {
+	if len(raw) == 0 {
+		return
+	}
+	var m ExtractionMetrics
+	if err := json.Unmarshal(raw, &m); err != nil {
+		return
+	}
+
+	a.mu.Lock()
+	defer a.mu.Unlock()
+
+	file, ok := a.files[filename]
+	if !ok {
+		file = &ExtractionMetrics{StageSeconds: map[string]float64{}, Counters: map[string]int{}}
+		a.files[filename] = file
+	}
+	for _, target := range []*ExtractionMetrics{&a.total, file} {
+		for name, seconds := range m.StageSeconds {
+			target.StageSeconds[name] += seconds
+		}
+		for name, count := range m.Counters {
+			target.Counters[name] += count
+		}
+	}
+}
+
+// WriteJSON writes the per-file and total metrics as one JSON document
+func (a *MetricsAggregator) WriteJSON(f *os.File) error {
+	a.mu.Lock()
+	defer a.mu.Unlock()
+
+	enc := json.NewEncoder(f)
+	return enc.Encode(struct {
+		Files map[string]*ExtractionMetrics `json:"files"`
+		Total ExtractionMetrics             `json:"total"`
+	}{a.files, a.total})
+}
@@ -0,0 +1,302 @@
+package processor
+
+import (
+	"container/heap"
+	"encoding/json"
+	"fmt"
+	"log"
+	"math"
+	"os"
+	"path/filepath"
+	"strings"
+	"sync"
+	"sync/atomic"
+	"time"
+
+	"github.com/2003Aditya/internal/utils"
+)
+
+const (
+	// MinChunkPages is the smallest page range a PDF is split into; smaller
+	// PDFs are extracted as one task without a separate profile request
+	MinChunkPages = 20
+
+	// TasksPerWorker is how many tasks the corpus is split into per worker,
+	// so that workers finishing early still find work in the queue
+	TasksPerWorker = 4
+)
+
+type taskKind int
+
+const (
+	fileTask    taskKind = iota // whole PDF in one request
+	profileTask                 // profile a PDF, then queue its page ranges
+	rangeTask                   // one page range of a profiled PDF
+)
+
+// job is one input PDF and the results of its tasks
+type job struct {
+	name        string
+	path        string
+	pages       int
+	costPerPage float64 // estimated cost of one page (file bytes per page)
+	chunkPages  int
+	started     time.Time
+
+	profile json.RawMessage
+	merger  *OutlineMerger
+	pending atomic.Int32 // tasks of this job not finished yet
+}
+
+type task struct {
+	job        *job
+	kind       taskKind
+	start, end int
+}
+
+// cost estimates how long the task takes. Profiles go first because they
+// unlock the page ranges of their PDF.
+func (t *task) cost() float64 {
+	if t.kind == profileTask {
+		return math.Inf(1)
+	}
+	return float64(t.end-t.start) * t.job.costPerPage
+}
+
+// taskQueue is a max-heap of tasks by estimated cost
+type taskQueue []*task
+
+func (q taskQueue) Len() int            { return len(q) }
+func (q taskQueue) Less(i, j int) bool  { return q[i].cost() > q[j].cost() }
+func (q taskQueue) Swap(i, j int)       { q[i], q[j] = q[j], q[i] }
+func (q *taskQueue) Push(x interface{}) { *q = append(*q, x.(*task)) }
+func (q *taskQueue) Pop() interface{} {
+	old := *q
+	t := old[len(old)-1]
+	*q = old[:len(old)-1]
+	return t
+}
+
+// Scheduler runs the tasks of all input PDFs on one shared worker pool,
+// largest first. Workers take the next task as soon as they are idle, and a
+// page range is split in two when other workers would otherwise sit idle.
+type Scheduler struct {
+	pool *WorkerPool
+
+	mu          sync.Mutex
+	cond        *sync.Cond
+	queue       taskQueue
+	outstanding int // queued or running tasks
+	idle        int // workers waiting for a task
+}
+
+// NewScheduler creates a scheduler running its tasks on the given pool
+func NewScheduler(pool *WorkerPool) *Scheduler {
+	s := &Scheduler{pool: pool}
+	s.cond = sync.NewCond(&s.mu)
+	return s
+}
+
+func (s *Scheduler) push(t *task) {
+	s.mu.Lock()
+	heap.Push(&s.queue, t)
+	s.outstanding++
+	s.mu.Unlock()
+	s.cond.Signal()
+}
+
+// next blocks until a task is available. It returns nil once all tasks are done.
+func (s *Scheduler) next() *task {
+	s.mu.Lock()
+	defer s.mu.Unlock()
+
+	s.idle++
+	for s.queue.Len() == 0 && s.outstanding > 0 {
+		s.cond.Wait()
+	}
+	s.idle--
+	if s.queue.Len() == 0 {
+		return nil
+	}
+
+	t := heap.Pop(&s.queue).(*task)
+
+	// Give the second half of a large range to a worker that has nothing to do
+	if t.kind == rangeTask && s.queue.Len() < s.idle && t.end-t.start >= 2*MinChunkPages {
+		mid := t.start + (t.end-t.start)/2
+		t.job.pending.Add(1)
+		t.job.merger.AddSource(mid)
+		heap.Push(&s.queue, &task{job: t.job, kind: rangeTask, start: mid, end: t.end})
+		s.outstanding++
+		t = &task{job: t.job, kind: rangeTask, start: t.start, end: mid}
+		s.cond.Signal()
+	}
+	return t
+}
+
+func (s *Scheduler) done() {
+	s.mu.Lock()
+	s.outstanding--
+	finished := s.outstanding == 0
+	s.mu.Unlock()
+	if finished {
+		s.cond.Broadcast()
+	}
+}
+
+// ProcessAll extracts the outlines of all given PDFs in inputDir into outputDir
+func (s *Scheduler) ProcessAll(filenames []string) {
+	jobs := s.plan(filenames)
+
+	for _, j := range jobs {
+		fmt.Printf("📄 Processing: %s (%d pages, %d per task)\n", j.name, j.pages, j.chunkPages)
+		j.started = time.Now()
+		j.merger = NewOutlineMerger(j.name, j.pages)
+		j.pending.Store(1)
+		if j.chunkPages >= j.pages {
+			j.merger.AddSource(0)
+			s.push(&task{job: j, kind: fileTask, start: 0, end: j.pages})
+		} else {
+			s.push(&task{job: j, kind: profileTask})
+		}
+	}
+
+	var wg sync.WaitGroup
+	for i := 0; i < PoolSize; i++ {
+		wg.Add(1)
+		go func() {
+			defer wg.Done()
+			for t := s.next(); t != nil; t = s.next() {
+				s.run(t)
+				s.done()
+			}
+		}()
+	}
+	wg.Wait()
+}
+
+// plan counts the pages of every PDF and chooses its chunk size from the
+// estimated cost of the whole corpus
+func (s *Scheduler) plan(filenames []string) []*job {
+	jobs := make([]*job, len(filenames))
+	var wg sync.WaitGroup
+	for i, filename := range filenames {
+		wg.Add(1)
+		go func(i int, filename string) {
+			defer wg.Done()
+			pdfPath := filepath.Join(inputDir, filename)
+			pages, err := s.pool.CountPages(pdfPath)
+			if err != nil {
+				log.Printf("❌ Failed to open %s: %v", filename, err)
+				return
+			}
+			info, err := os.Stat(pdfPath)
+			if err != nil || pages == 0 {
+				log.Printf("❌ Skipping %s: no pages", filename)
+				return
+			}
+			jobs[i] = &job{name: filename, path: pdfPath, pages: pages, costPerPage: float64(info.Size()) / float64(pages)}
+		}(i, filename)
+	}
+	wg.Wait()
+
+	planned := jobs[:0]
+	totalCost := 0.0
+	for _, j := range jobs {
+		if j != nil {
+			planned = append(planned, j)
+			totalCost += float64(j.pages) * j.costPerPage
+		}
+	}
+
+	targetCost := totalCost / float64(PoolSize*TasksPerWorker)
+	for _, j := range planned {
+		chunkPages := int(math.Ceil(targetCost / j.costPerPage))
+		if chunkPages < MinChunkPages {
+			chunkPages = MinChunkPages
+		}
+		j.chunkPages = chunkPages
+	}
+	return planned
+}
+
+func (s *Scheduler) run(t *task) {
+	j := t.job
+	startTime := time.Now()
+
+	switch t.kind {
+	case fileTask:
+		output, err := s.pool.Extract(j.path)
+		if err != nil {
+			log.Printf("❌ Error processing %s: %v", j.name, err)
+			j.merger.Fail(0, err)
+		} else {
+			addOutput(j.merger, 0, &output)
+		}
+
+	case profileTask:
+		fmt.Printf("🧪 Profiling: %s\n", j.path)
+		profile, output, err := s.pool.Profile(j.path)
+		if err != nil {
+			log.Printf("❌ Failed to profile %s: %v", j.name, err)
+			break
+		}
+		if output != nil {
+			// The PDF's bookmarks are its outline, so there is nothing to split
+			j.merger.AddSource(0)
+			addOutput(j.merger, 0, output)
+			break
+		}
+		j.profile = profile
+		for start := 0; start < j.pages; start += j.chunkPages {
+			j.merger.AddSource(start)
+		}
+		for start := 0; start < j.pages; start += j.chunkPages {
+			j.pending.Add(1)
+			s.push(&task{job: j, kind: rangeTask, start: start, end: utils.Min(start+j.chunkPages, j.pages)})
+		}
+
+	case rangeTask:
+		fmt.Printf("🚀 %s: Processing pages %d–%d\n", j.name, t.start, t.end)
+		var part FinalOutput
+		var err error
+		if TimeBudget > 0 {
+			// Only whole results say how a range degraded
+			part, err = s.pool.ExtractRange(j.path, t.start, t.end, j.profile)
+		} else {
+			part, err = s.pool.StreamRange(j.path, t.start, t.end, j.profile,
+				func(title string) { j.merger.SetTitle(t.start, title) },
+				func(h Heading) { j.merger.Add(t.start, h) })
+		}
+		if err != nil {
+			log.Printf("❌ Error processing %s (%d–%d): %v", j.name, t.start, t.end, err)
+			j.merger.Fail(t.start, err)
+			break
+		}
+		fmt.Printf("✅ %s: Finished %d–%d in %v\n", j.name, t.start, t.end, time.Since(startTime))
+		if len(part.Degraded) > 0 {
+			log.Printf("⚠️ %s (%d–%d) ran over its time budget: %s", j.name, t.start, t.end, strings.Join(part.Degraded, ", "))
+		}
+		addOutput(j.merger, t.start, &part)
+	}
+
+	// The last task of a PDF completes its output
+	if j.pending.Add(-1) == 0 && j.merger.Close() {
+		fmt.Printf("📦 Merged final output: %s\n", outputPath(j.name))
+		if IndexEnabled {
+			if err := s.pool.Index(j.path, outputPath(j.name)); err != nil {
+				log.Printf("⚠️ Failed to index %s: %v", j.name, err)
+			}
+		}
+		fmt.Printf("⏱️ Finished %s in %v\n", j.name, time.Since(j.started))
+	}
+}
+
+// addOutput passes a complete result of the range starting at start to the merger
+func addOutput(m *OutlineMerger, start int, output *FinalOutput) {
+	m.SetTitle(start, output.Title)
+	for _, h := range output.Outline {
+		m.Add(start, h)
+	}
+	m.Done(start, output)
+}
@@ -0,0 +1,265 @@
+package processor
+
+import (
+	"bufio"
+	"bytes"
+	"encoding/json"
+	"errors"
+	"fmt"
+	"io"
+	"log"
+	"os"
+	"os/exec"
+	"path/filepath"
+	"strconv"
+)
+
+// workerRequest is one line of the extract.py --worker protocol
+type workerRequest struct {
+	Op    string `json:"op"`
+	PDF   string `json:"pdf"`
+	Start *int   `json:"start,omitempty"`
+	End   *int   `json:"end,omitempty"`
+
+	// Profile is the document profile returned by a "profile" request
+	Profile json.RawMessage `json:"profile,omitempty"`
+
+	// Metrics asks the worker for per-stage timers and counters
+	Metrics bool `json:"metrics,omitempty"`
+
+	// Bookmarks lets the worker use the PDF's embedded bookmarks as the outline
+	Bookmarks bool `json:"bookmarks,omitempty"`
+
+	// TimeBudget is the number of seconds the extraction may take before it degrades
+	TimeBudget float64 `json:"time_budget,omitempty"`
+
+	// LowMemory makes the worker release pages as it goes to keep peak memory flat
+	LowMemory bool `json:"low_memory,omitempty"`
+
+	// Output is the outline JSON an "index" request adds to the heading index
+	Output string `json:"output,omitempty"`
+
+	// StyleProfiles lets the worker reuse the statistics of PDFs of the same style
+	StyleProfiles bool `json:"style_profiles,omitempty"`
+}
+
+// BookmarksEnabled uses embedded bookmarks instead of layout analysis when they
+// look usable (set OUTLINE_BOOKMARKS=1)
+var BookmarksEnabled = os.Getenv("OUTLINE_BOOKMARKS") == "1"
+
+// TimeBudget bounds each chunk's extraction time in seconds; over budget the
+// worker samples statistics, drops to pattern-only classification and finally
+// returns a partial outline (set OUTLINE_TIME_BUDGET; unset means no budget)
+var TimeBudget, _ = strconv.ParseFloat(os.Getenv("OUTLINE_TIME_BUDGET"), 64)
+
+// LowMemoryEnabled extracts each chunk in bounded memory, at some cost in speed
+// (set OUTLINE_LOW_MEMORY=1)
+var LowMemoryEnabled = os.Getenv("OUTLINE_LOW_MEMORY") == "1"
+
+// IndexEnabled adds every finished outline to the heading index at
+// OUTLINE_INDEX, which the workers open themselves (see extract.py --query)
+var IndexEnabled = os.Getenv("OUTLINE_INDEX") != ""
+
+// StyleProfilesEnabled skips the statistics pass for PDFs made from a template
+// seen before, using the statistics stored in the shared cache (set OUTLINE_STYLE_PROFILES=1)
+var StyleProfilesEnabled = os.Getenv("OUTLINE_STYLE_PROFILES") == "1"
+
+// workerResponse is the reply to a workerRequest
+type workerResponse struct {
+	OK     bool        `json:"ok"`
+	Error  string      `json:"error"`
+	Pages  int         `json:"pages"`
+	Result FinalOutput `json:"result"`
+
+	Profile json.RawMessage `json:"profile"`
+	Metrics json.RawMessage `json:"metrics"`
+
+	// Title or Heading is set on the messages a "stream" request sends before its response
+	Title   *string  `json:"title"`
+	Heading *Heading `json:"heading"`
+}
+
+// Worker is a long-lived `python3 extract.py --worker` process
+type Worker struct {
+	cmd    *exec.Cmd
+	stdin  io.WriteCloser
+	stdout *bufio.Reader
+}
+
+func startWorker() (*Worker, error) {
+	// Workers share an on-disk result cache so unchanged PDFs are not extracted again
+	cmd := exec.Command("python3", pythonScript, "--worker", "--cache-dir", cacheDir)
+	cmd.Stderr = os.Stderr
+
+	stdin, err := cmd.StdinPipe()
+	if err != nil {
+		return nil, err
+	}
+	stdout, err := cmd.StdoutPipe()
+	if err != nil {
+		return nil, err
+	}
+	if err := cmd.Start(); err != nil {
+		return nil, err
+	}
+
+	return &Worker{cmd: cmd, stdin: stdin, stdout: bufio.NewReader(stdout)}, nil
+}
+
+// call sends one request and returns its response. Messages streamed ahead
+// of the response are passed to emit.
+func (w *Worker) call(req workerRequest, emit func(workerResponse)) (workerResponse, error) {
+	var resp workerResponse
+
+	line, err := json.Marshal(req)
+	if err != nil {
+		return resp, err
+	}
+	if _, err := w.stdin.Write(append(line, '\n')); err != nil {
+		return resp, err
+	}
+
+	for {
+		// Skip anything that isn't a JSON object (e.g. library warnings printed at import time)
+		reply, err := w.stdout.ReadBytes('\n')
+		if err != nil {
+			return resp, err
+		}
+		if trimmed := bytes.TrimSpace(reply); len(trimmed) == 0 || trimmed[0] != '{' {
+			fmt.Fprintf(os.Stderr, "%s", reply)
+			continue
+		}
+
+		resp = workerResponse{}
+		if err := json.Unmarshal(reply, &resp); err != nil {
+			return resp, err
+		}
+		if resp.Title == nil && resp.Heading == nil {
+			return resp, nil
+		}
+		if emit != nil {
+			emit(resp)
+		}
+	}
+}
+
+func (w *Worker) stop() {
+	w.stdin.Close()
+	w.cmd.Wait()
+}
+
+// WorkerPool hands out a fixed number of Python workers to concurrent callers
+type WorkerPool struct {
+	workers chan *Worker
+}
+
+// NewWorkerPool starts size worker processes
+func NewWorkerPool(size int) (*WorkerPool, error) {
+	pool := &WorkerPool{workers: make(chan *Worker, size)}
+	for i := 0; i < size; i++ {
+		w, err := startWorker()
+		if err != nil {
+			pool.Close()
+			return nil, fmt.Errorf("starting worker %d: %w", i+1, err)
+		}
+		pool.workers <- w
+	}
+	return pool, nil
+}
+
+// call runs one request on the next idle worker. A worker whose pipe broke
+// is replaced so that the pool keeps its size.
+func (p *WorkerPool) call(req workerRequest) (workerResponse, error) {
+	return p.stream(req, nil)
+}
+
+// stream is call for requests whose headings arrive one message at a time
+func (p *WorkerPool) stream(req workerRequest, emit func(workerResponse)) (workerResponse, error) {
+	w := <-p.workers
+
+	resp, err := w.call(req, emit)
+	if err != nil {
+		log.Printf("⚠️ Worker failed, restarting: %v", err)
+		w.cmd.Process.Kill()
+		w.stop()
+		replacement, startErr := startWorker()
+		if startErr != nil {
+			log.Fatalf("❌ Could not restart worker: %v", startErr)
+		}
+		w = replacement
+	}
+	p.workers <- w
+
+	if err == nil && !resp.OK {
+		err = errors.New(resp.Error)
+	}
+	return resp, err
+}
+
+// CountPages returns the number of pages in the PDF
+func (p *WorkerPool) CountPages(pdfPath string) (int, error) {
+	resp, err := p.call(workerRequest{Op: "count", PDF: pdfPath})
+	return resp.Pages, err
+}
+
+// Profile computes the document-wide statistics of the PDF once, so that
+// all chunks classify headings against the same baselines. With bookmarks
+// enabled and usable, it returns the finished outline instead of a profile,
+// and the PDF needs no page ranges.
+func (p *WorkerPool) Profile(pdfPath string) (json.RawMessage, *FinalOutput, error) {
+	resp, err := p.call(workerRequest{Op: "profile", PDF: pdfPath, Metrics: MetricsEnabled, Bookmarks: BookmarksEnabled, StyleProfiles: StyleProfilesEnabled})
+	Metrics.Add(filepath.Base(pdfPath), resp.Metrics)
+	if err == nil && resp.Profile == nil {
+		return nil, &resp.Result, nil
+	}
+	return resp.Profile, nil, err
+}
+
+// Extract returns the outline of the whole PDF
+func (p *WorkerPool) Extract(pdfPath string) (FinalOutput, error) {
+	resp, err := p.call(workerRequest{Op: "extract", PDF: pdfPath, Metrics: MetricsEnabled, Bookmarks: BookmarksEnabled, TimeBudget: TimeBudget, LowMemory: LowMemoryEnabled, StyleProfiles: StyleProfilesEnabled})
+	Metrics.Add(filepath.Base(pdfPath), resp.Metrics)
+	return resp.Result, err
+}
+
+// ExtractRange returns the outline of pages [start, end) of the PDF, using
+// the given document profile (may be nil)
+func (p *WorkerPool) ExtractRange(pdfPath string, start, end int, profile json.RawMessage) (FinalOutput, error) {
+	resp, err := p.call(workerRequest{Op: "extract", PDF: pdfPath, Start: &start, End: &end, Profile: profile, Metrics: MetricsEnabled, Bookmarks: BookmarksEnabled, TimeBudget: TimeBudget, LowMemory: LowMemoryEnabled, StyleProfiles: StyleProfilesEnabled})
+	Metrics.Add(filepath.Base(pdfPath), resp.Metrics)
+	return resp.Result, err
+}
+
+// StreamRange is ExtractRange with the title passed to onTitle first and each
+// heading passed to onHeading as soon as the worker has classified its page.
+// The returned output only carries the title.
+func (p *WorkerPool) StreamRange(pdfPath string, start, end int, profile json.RawMessage, onTitle func(string), onHeading func(Heading)) (FinalOutput, error) {
+	req := workerRequest{Op: "stream", PDF: pdfPath, Start: &start, End: &end, Profile: profile, Metrics: MetricsEnabled, Bookmarks: BookmarksEnabled, LowMemory: LowMemoryEnabled, StyleProfiles: StyleProfilesEnabled}
+	resp, err := p.stream(req, func(msg workerResponse) {
+		if msg.Title != nil {
+			onTitle(*msg.Title)
+		} else {
+			onHeading(*msg.Heading)
+		}
+	})
+	Metrics.Add(filepath.Base(pdfPath), resp.Metrics)
+	return resp.Result, err
+}
+
+// Index adds the finished outline of the PDF at outputPath to the heading index
+func (p *WorkerPool) Index(pdfPath, outputPath string) error {
+	_, err := p.call(workerRequest{Op: "index", PDF: pdfPath, Output: outputPath})
+	return err
+}
+
+// Close stops all workers. It must only be called once no requests are in flight.
+func (p *WorkerPool) Close() {
+	for {
+		select {
+		case w := <-p.workers:
+			w.stop()
+		default:
+			return
+		}
+	}
+}